@@ -0,0 +1,92 @@
+"""
+    Compare the thread-pool path (parallel_process + YahooAPIParser) with the asyncio engine against a local stub
+    HTTP server that answers every request with a small quoteSummary-like JSON after a fixed latency.
+
+    usage: python -m benchmarks.bench_async_engine [--requests 3000] [--latency 0.05]
+"""
+import argparse
+import asyncio
+import json
+import resource
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from configs import job_configs as jcfg
+
+PAYLOAD = json.dumps({'quoteSummary': {'result': [{'price': {'regularMarketPrice': {'raw': 1.0, 'fmt': '1.00'}}}],
+                                       'error': None}}).encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.05
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(PAYLOAD)))
+        self.end_headers()
+        self.wfile.write(PAYLOAD)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(latency):
+    StubHandler.latency = latency
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.request_queue_size = 1024
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_thread_path(urls):
+    from util.parallel_process import parallel_process
+    from util.request_website import YahooAPIParser
+    return parallel_process(urls, lambda url: YahooAPIParser(url=url, proxy=False).parse(), n_jobs=jcfg.WORKER,
+                            front_num=0, use_tqdm=False)
+
+
+def run_async_path(urls):
+    from util.async_request_website import AsyncExtractionEngine
+    engine = AsyncExtractionEngine(proxy=False, concurrency=jcfg.ASYNC_CONCURRENCY)
+    return engine.run(urls, lambda url: url, lambda url, js: js, use_tqdm=False)
+
+
+def run_one(mode, n_requests, latency):
+    server = start_stub_server(latency)
+    urls = [f'http://127.0.0.1:{server.server_port}/v10/finance/quoteSummary/T{i}' for i in range(n_requests)]
+    start = time.perf_counter()
+    out = run_thread_path(urls) if mode == 'thread' else run_async_path(urls)
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    ok = sum(1 for js in out if isinstance(js, dict))
+    # ru_maxrss is in kilobytes on linux
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({'mode': mode, 'requests': n_requests, 'ok': ok, 'seconds': round(elapsed, 2),
+                      'requests_per_sec': round(n_requests / elapsed, 1), 'peak_rss_mb': round(rss_mb, 1)}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--mode', choices=['thread', 'async'])
+    args = parser.parse_args()
+
+    if args.mode is not None:
+        run_one(args.mode, args.requests, args.latency)
+        return
+
+    # run each path in its own interpreter so the peak RSS figures do not bleed into each other
+    for mode in ['thread', 'async']:
+        subprocess.run([sys.executable, '-m', 'benchmarks.bench_async_engine', '--mode', mode,
+                        '--requests', str(args.requests), '--latency', str(args.latency)], check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+    Compare the rows per second written into a price-like table on a local MySQL by the per-ticker
+    to_sql(method='multi', chunksize=200) insert_db used to make, one executemany batch over all the tickers (the
+    BatchWriter INSERT path) and LOAD DATA LOCAL INFILE through a staging table (util.bulk_load), on synthetic daily
+    bars. The server needs local_infile=ON.
+
+    usage: python -m benchmarks.bench_bulk_load --dsn mysql+mysqlconnector://user:pw@localhost:3306/test
+                                                [--tickers 50] [--years 20]
+"""
+import argparse
+import json
+import time
+from datetime import date
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+from configs import job_configs as jcfg
+from util.bulk_load import bulk_load
+
+TABLE = 'bench_price'
+
+
+def synthetic_bars(ticker, years, seed):
+    rnd = np.random.default_rng(seed)
+    index = pd.bdate_range(end=date(2021, 12, 31), periods=252 * years, name='timestamp')
+    close = 50 * np.exp(np.cumsum(rnd.normal(0, 0.02, len(index))))
+    df = pd.DataFrame({'high': close * 1.01, 'close': close, 'open': close, 'low': close * 0.99,
+                       'volume': rnd.integers(1e5, 1e7, len(index)), 'adjclose': close}, index=index)
+    df['ticker'] = ticker
+    df['updated_dt'] = date(2021, 12, 31)
+    return df
+
+
+def create_table(con):
+    with con.begin() as conn:
+        conn.exec_driver_sql(f'DROP TABLE IF EXISTS {TABLE}')
+        conn.exec_driver_sql(f"""CREATE TABLE {TABLE} (
+                                    `timestamp` DATETIME, high DOUBLE, close DOUBLE, open DOUBLE, low DOUBLE,
+                                    volume BIGINT, adjclose DOUBLE, ticker VARCHAR(20), updated_dt DATE,
+                                    PRIMARY KEY (ticker, `timestamp`))""")
+
+
+def per_ticker_multi(frames, con):
+    for df in frames:
+        df.to_sql(name=TABLE, con=con, if_exists='append', index=True, method='multi', chunksize=200)
+
+
+def one_executemany(frames, con):
+    pd.concat(frames).to_sql(name=TABLE, con=con, if_exists='append', index=True, chunksize=jcfg.BATCH_WRITER_CHUNK_SIZE)
+
+
+def load_data(frames, con):
+    bulk_load(frames, TABLE, con, index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dsn', required=True, help='sqlalchemy url of a scratch MySQL database')
+    parser.add_argument('--tickers', type=int, default=50)
+    parser.add_argument('--years', type=int, default=20)
+    args = parser.parse_args()
+
+    con = create_engine(args.dsn, connect_args={'allow_local_infile': True})
+    frames = [synthetic_bars(f'SYN{i}', args.years, i) for i in range(args.tickers)]
+    rows = sum(len(df) for df in frames)
+    for name, function in [('to_sql_multi_per_ticker', per_ticker_multi), ('executemany_batch', one_executemany),
+                           ('load_data_infile', load_data)]:
+        create_table(con)
+        start = time.perf_counter()
+        function(frames, con)
+        seconds = time.perf_counter() - start
+        stored = pd.read_sql(f'SELECT COUNT(*) AS n FROM {TABLE}', con)['n'][0]
+        assert stored == rows, f'{name}: {stored} rows stored out of {rows}'
+        print(json.dumps({'path': name, 'rows': rows, 'seconds': round(seconds, 2),
+                          'rows_per_sec': round(rows / seconds)}))
+    with con.begin() as conn:
+        conn.exec_driver_sql(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+if __name__ == '__main__':
+    main()
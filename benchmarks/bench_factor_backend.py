@@ -0,0 +1,89 @@
+"""
+    Measure how CalculateFactors.run_pipeline scales on the thread backend and on the process backend of
+    parallel_iter, on synthetic stocks (10 years of daily prices, 40 quarters of fundamentals) so that no database or
+    Yahoo access is needed. The market series and the date dimension are preloaded once per worker by
+    init_factor_worker, the way FactorJob does it.
+
+    usage: python -m benchmarks.bench_factor_backend [--stocks 64] [--workers 1,2,4,8]
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from datetime import date
+import numpy as np
+import pandas as pd
+from modules.extract_factors import CalculateFactors, init_factor_worker, run_stock_pipeline
+from util.parallel_process import parallel_iter
+
+START_DT = date(2011, 1, 1)
+UPDATED_DT = date(2021, 1, 1)
+
+
+def synthetic_prices(seed):
+    rnd = np.random.default_rng(seed)
+    index = pd.bdate_range(START_DT, UPDATED_DT, name='asOfDate')
+    close = 50 * np.exp(np.cumsum(rnd.normal(0, 0.02, len(index))))
+    return pd.DataFrame({'high': close * 1.01, 'close': close, 'open': close, 'low': close * 0.99,
+                         'volume': rnd.integers(1e5, 1e7, len(index)), 'adjclose': close}, index=index)
+
+
+def synthetic_time_d():
+    index = pd.date_range(START_DT, UPDATED_DT, name='asOfDate')
+    return pd.DataFrame({'dayofweek': (index.dayofweek + 1) % 7}, index=index)
+
+
+def synthetic_stock(seed):
+    rnd = np.random.default_rng(seed)
+    stock = CalculateFactors.__new__(CalculateFactors)
+    stock.stock = f'SYN{seed}'
+    stock.start_dt, stock.updated_dt = START_DT, UPDATED_DT
+    stock.price_f = synthetic_prices(seed)
+    stock.market_f = synthetic_prices(0)
+    stock.time_d = synthetic_time_d()
+    quarters = pd.date_range(START_DT, UPDATED_DT, freq='Q', name='asOfDate')
+    columns = CalculateFactors.trailing_factors_list + ['quarterlyBasicAverageShares', 'quarterlyStockholdersEquity',
+                                                        'quarterlyTotalAssets']
+    stock.quarterly_data = pd.DataFrame(rnd.uniform(1e6, 1e9, (len(quarters), len(columns))), index=quarters,
+                                        columns=columns)
+    stock.quarterly_data['ticker'] = stock.stock
+    stock.quarterly_data['reportDate'] = quarters
+    consensus = pd.bdate_range(START_DT, UPDATED_DT, name='asOfDate')
+    stock.yahoo_consensus = pd.DataFrame({'targetMedianPrice': rnd.uniform(40, 60, len(consensus))}, index=consensus)
+    stock.last_weekly_entry = START_DT
+    stock.loggerFileName = None
+    stock.logger = logging.getLogger('factors')
+    return stock
+
+
+def stocks_per_second(stocks, n_jobs, backend):
+    start = time.perf_counter()
+    kwargs = {'initializer': init_factor_worker, 'initargs': (START_DT, UPDATED_DT, synthetic_prices(0),
+                                                              synthetic_time_d())} if backend == 'process' else {}
+    results = parallel_iter(((s.stock, s) for s in stocks), run_stock_pipeline, n_jobs, use_tqdm=False,
+                            backend=backend, **kwargs)
+    for _, result in results:
+        if isinstance(result, Exception):
+            raise result
+    return len(stocks) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stocks', type=int, default=64)
+    parser.add_argument('--workers', default=','.join(str(n) for n in (1, 2, 4, 8, 16) if n <= (os.cpu_count() or 1)))
+    args = parser.parse_args()
+
+    stocks = [synthetic_stock(seed) for seed in range(1, args.stocks + 1)]
+    base = None
+    for n_jobs in [int(n) for n in args.workers.split(',')]:
+        thread = stocks_per_second(stocks, n_jobs, 'thread')
+        process = stocks_per_second(stocks, n_jobs, 'process')
+        base = base or process
+        print(json.dumps({'workers': n_jobs, 'thread_stocks_per_s': round(thread, 1),
+                          'process_stocks_per_s': round(process, 1), 'process_scaling': round(process / base, 2)}))
+
+
+if __name__ == '__main__':
+    main()
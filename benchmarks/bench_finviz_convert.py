@@ -0,0 +1,67 @@
+"""
+    Compare the per-cell convert_str_to_num apply path FinvizParserPerPage used to run over the 70 screener columns
+    with the vectorized convert_columns pass, on a synthetic screener frame of the same layout (10k rows by default).
+
+    usage: python -m benchmarks.bench_finviz_convert [--rows 10000] [--repeat 3]
+"""
+import argparse
+import json
+import random
+import time
+import numpy as np
+import pandas as pd
+from benchmarks.bench_finviz_parser import synthetic_value
+from configs import finviz_configs as fcfg
+from util.finviz_cnv_str_to_num import convert_columns, convert_str_to_num
+
+
+def synthetic_frame(rows, seed=0):
+    rnd = random.Random(seed)
+    return pd.DataFrame([{fcfg.COL_RENAMES[c]: synthetic_value(c, rnd) for c in fcfg.COL_RENAMES}
+                         for _ in range(rows)], dtype=object)
+
+
+def convert_with_apply(df: pd.DataFrame):
+    df = df.replace(to_replace='-', value=np.NaN)
+    for column in df.columns:
+        df[column] = df[column].apply(convert_str_to_num)
+    df['ipo_date'] = pd.to_datetime(df['ipo_date'], format='%m/%d/%Y')
+    return df
+
+
+def check_same(old: pd.DataFrame, new: pd.DataFrame):
+    for column, kind in fcfg.FINVIZ_COLUMN_TYPES.items():
+        if kind == 'text':
+            pd.testing.assert_series_equal(old[column], new[column], check_dtype=False)
+        elif kind == 'date':
+            pd.testing.assert_series_equal(old[column], new[column])
+        else:
+            expected = pd.to_numeric(old[column], errors='coerce').astype('float64')
+            actual = new[column].astype('float64')
+            assert np.allclose(expected, actual, rtol=1e-9, atol=1, equal_nan=True), f'{column} differs'
+
+
+def cpu_time(function, df, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        function(df)
+    return (time.process_time() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    df = synthetic_frame(args.rows)
+    check_same(convert_with_apply(df), convert_columns(df))
+    old = cpu_time(convert_with_apply, df, args.repeat)
+    new = cpu_time(convert_columns, df, args.repeat)
+    print(json.dumps({'rows': args.rows, 'apply_ms': round(old * 1000, 1), 'vectorized_ms': round(new * 1000, 1),
+                      'speedup': round(old / new, 1),
+                      'dtypes': convert_columns(df).dtypes.astype(str).value_counts().to_dict()}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+    Compare the CPU time per Finviz screener page of the two pd.read_html passes FinvizParserPerPage used to make
+    (table 8 for the data, table 7 for the count) with the single targeted lxml pass, on saved pages or on
+    synthetic pages of the same layout.
+
+    usage: python -m benchmarks.bench_finviz_parser [--pages DIR] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import random
+import time
+import pandas as pd
+from configs import finviz_configs as fcfg
+from util.finviz_cnv_str_to_num import convert_columns
+from util.request_website import FinvizParserPerPage
+
+
+class _Page:
+    def __init__(self, text):
+        self.text = text
+
+
+def parse_with_read_html(page: str):
+    df = pd.read_html(page)[8]
+    df.columns = df.iloc[0]
+    df = df.iloc[1:]
+    df = convert_columns(df.rename(columns=fcfg.COL_RENAMES))
+    count = pd.read_html(page)[7]
+    return df, int(count[0][0].split(' ')[1])
+
+
+def parse_with_xpath(page: str):
+    parser = FinvizParserPerPage(url='https://finviz.com/screener.ashx', proxy=False)
+    parser.response = lambda stream=False: _Page(page)
+    return parser.parse(), parser.no_of_population
+
+
+def synthetic_value(column, rnd):
+    if rnd.random() < 0.05:
+        return '-'
+    if column == 'Ticker':
+        return ''.join(rnd.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ') for _ in range(4))
+    if column in ('Company', 'Sector', 'Industry', 'Country'):
+        return f'{column} {rnd.randint(1, 50)}'
+    if column in ('Market Cap', 'Outstanding', 'Float', 'Avg Volume'):
+        return f"{rnd.uniform(1, 999):.2f}{rnd.choice('KMBT')}"
+    if column == 'Volume':
+        return f'{rnd.randint(1000, 90000000):,}'
+    if column == 'Earnings':
+        return 'Feb 01 AMC'
+    if column == 'IPO Date':
+        return f'{rnd.randint(1, 12)}/{rnd.randint(1, 28)}/{rnd.randint(1980, 2021)}'
+    if fcfg.FINVIZ_COLUMN_TYPES[fcfg.COL_RENAMES[column]] == 'percent':
+        return f'{rnd.uniform(-50, 50):.2f}%'
+    return f'{rnd.uniform(0, 100):.2f}'
+
+
+def synthetic_page(seed=0, rows=20):
+    rnd = random.Random(seed)
+    columns = list(fcfg.COL_RENAMES.keys())
+    nav = ''.join(f'<table><tr><td><a href="/x{i}">menu {i}</a></td><td>{"z" * 200}</td></tr></table>'
+                  for i in range(7))
+    count = '<table><tr><td class="count-text"><b>Total: </b>8923 #1</td></tr></table>'
+    header = '<tr valign="middle">' + ''.join(f'<td class="table-top">{c}</td>' for c in columns) + '</tr>'
+    body = ''.join('<tr class="table-dark-row-cp">' +
+                   ''.join(f'<td class="screener-body-table-nw"><a class="screener-link">'
+                           f'{synthetic_value(c, rnd)}</a></td>' for c in columns) + '</tr>'
+                   for _ in range(rows))
+    return f'<html><body>{nav}{count}<table width="100%">{header}{body}</table>{"<p>x</p>" * 500}</body></html>'
+
+
+def load_pages(path):
+    if path is None:
+        return {f'synthetic-{i}': synthetic_page(i) for i in range(3)}
+    pages = {}
+    for name in sorted(os.listdir(path)):
+        with open(os.path.join(path, name), encoding='utf-8') as f:
+            pages[name] = f.read()
+    return pages
+
+
+def cpu_per_page(function, page, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        function(page)
+    return (time.process_time() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', help='directory of saved Finviz screener pages, synthetic pages are used if omitted')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for name, page in load_pages(args.pages).items():
+        old_df, old_count = parse_with_read_html(page)
+        new_df, new_count = parse_with_xpath(page)
+        assert old_count == new_count, f'{name}: the counts differ'
+        pd.testing.assert_frame_equal(old_df.reset_index(drop=True), new_df.reset_index(drop=True),
+                                      check_dtype=False, check_names=False)
+        old = cpu_per_page(parse_with_read_html, page, args.repeat)
+        new = cpu_per_page(parse_with_xpath, page, args.repeat)
+        print(json.dumps({'page': name, 'kb': round(len(page) / 1024, 1), 'read_html_ms': round(old * 1000, 2),
+                          'xpath_ms': round(new * 1000, 2), 'speedup': round(old / new, 1)}))
+
+
+if __name__ == '__main__':
+    main()
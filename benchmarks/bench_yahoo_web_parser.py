@@ -0,0 +1,75 @@
+"""
+    Compare the CPU time per page of the BeautifulSoup extraction YahooWebParser used to do with the streaming
+    EmbeddedJSONScanner, on saved Yahoo pages (profile/screener) or on synthetic pages of a similar shape.
+
+    usage: python -m benchmarks.bench_yahoo_web_parser [--pages DIR] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import re
+import time
+from bs4 import BeautifulSoup
+from util.request_website import EmbeddedJSONScanner
+
+
+def parse_with_soup(page: bytes):
+    soup = BeautifulSoup(page.decode('utf-8'), 'html.parser')
+    script_data = soup.find('script', text=re.compile(r'\s--\sData\s--\s')).contents[0]
+    start = script_data.find("context") - 2
+    return json.loads(script_data[start:-12]) if start >= 0 else None
+
+
+def parse_with_scanner(page: bytes, chunk_size=64 * 1024):
+    scanner = EmbeddedJSONScanner()
+    for i in range(0, len(page), chunk_size):
+        if scanner.feed(page[i:i + chunk_size]):
+            break
+    return scanner.result()
+
+
+def synthetic_page(n_rows=2000, n_scripts=40):
+    # markup and scripts before the data script, the data blob, then the rest of the page
+    store = {'context': {'dispatcher': {'stores': {'QuoteSummaryStore': {
+        'assetProfile': {'longBusinessSummary': 'x' * 2000, 'fullTimeEmployees': 1000},
+        'rows': [{'symbol': f'T{i}', 'price': {'raw': i * 1.5, 'fmt': f'{i * 1.5:.2f}'}} for i in range(n_rows)]}}}}}
+    head = ''.join(f'<script>var s{i} = "{"y" * 2000}";</script><div class="c{i}">{"z" * 1000}</div>'
+                   for i in range(n_scripts))
+    data = f'<script>/* -- Data -- */\n(function (root) {{\nroot.App.main = {json.dumps(store)};\n}}(this));\n</script>'
+    tail = ''.join(f'<div class="t{i}"><span>{"w" * 1000}</span></div>' for i in range(n_scripts * 4))
+    return f'<html><head>{head}</head><body>{data}{tail}</body></html>'.encode('utf-8')
+
+
+def load_pages(path):
+    if path is None:
+        return {'synthetic': synthetic_page()}
+    pages = {}
+    for name in sorted(os.listdir(path)):
+        with open(os.path.join(path, name), 'rb') as f:
+            pages[name] = f.read()
+    return pages
+
+
+def cpu_per_page(function, page, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        function(page)
+    return (time.process_time() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', help='directory of saved Yahoo html pages, synthetic pages are used if omitted')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for name, page in load_pages(args.pages).items():
+        assert parse_with_soup(page) == parse_with_scanner(page), f'{name}: the two parsers disagree'
+        soup = cpu_per_page(parse_with_soup, page, args.repeat)
+        scanner = cpu_per_page(parse_with_scanner, page, args.repeat)
+        print(json.dumps({'page': name, 'kb': round(len(page) / 1024, 1), 'soup_ms': round(soup * 1000, 2),
+                          'scanner_ms': round(scanner * 1000, 2), 'speedup': round(soup / scanner, 1)}))
+
+
+if __name__ == '__main__':
+    main()
@@ -84,3 +84,30 @@ COL_RENAMES = {'Ticker': 'ticker',
                'Earnings': 'earnings',
                'Target Price': 'target_price',
                'IPO Date': 'ipo_date'}
+
+# value type of each renamed screener column, read by util.finviz_cnv_str_to_num.convert_columns
+# text: kept as is, number: plain decimal, percent: '12.5%' -> 0.125, suffix: '1.2B' -> 1200000000,
+# integer: '1,234' -> 1234, date: '%m/%d/%Y'
+FINVIZ_COLUMN_TYPES = {'ticker': 'text', 'company_name': 'text', 'sector': 'text', 'industry': 'text',
+                       'country': 'text', 'earnings': 'text',
+                       'market_cap': 'suffix', 'outstanding': 'suffix', 'float_shares': 'suffix',
+                       'avg_volume': 'suffix',
+                       'volume': 'integer',
+                       'pe': 'number', 'fwd_pe': 'number', 'peg': 'number', 'ps': 'number', 'pb': 'number',
+                       'pc': 'number', 'pfcf': 'number', 'eps': 'number', 'short_ratio': 'number',
+                       'curr_r': 'number', 'quick_r': 'number', 'ltdebt_eq': 'number', 'debt_eq': 'number',
+                       'beta': 'number', 'atr': 'number', 'rsi': 'number', 'recom': 'number',
+                       'rel_volume': 'number', 'price': 'number', 'target_price': 'number',
+                       'dividend': 'percent', 'payout_ratio': 'percent', 'eps_this_y': 'percent',
+                       'eps_next_y': 'percent', 'eps_past_5y': 'percent', 'eps_next_5y': 'percent',
+                       'sales_past_5y': 'percent', 'eps_q_q': 'percent', 'sales_q_q': 'percent',
+                       'insider_own': 'percent', 'insider_trans': 'percent', 'inst_own': 'percent',
+                       'inst_trans': 'percent', 'float_short': 'percent', 'roa': 'percent', 'roe': 'percent',
+                       'roi': 'percent', 'gross_m': 'percent', 'oper_m': 'percent', 'profit_m': 'percent',
+                       'perf_week': 'percent', 'perf_month': 'percent', 'perf_quart': 'percent',
+                       'perf_half': 'percent', 'perf_year': 'percent', 'perf_ytd': 'percent',
+                       'volatility_w': 'percent', 'volatility_m': 'percent', 'sma20': 'percent',
+                       'sma50': 'percent', 'sma200': 'percent', '50d_high': 'percent', '50d_low': 'percent',
+                       '52w_high': 'percent', '52w_low': 'percent', 'from_open': 'percent', 'gap': 'percent',
+                       'price_chg': 'percent',
+                       'ipo_date': 'date'}
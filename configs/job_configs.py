@@ -1,3 +1,4 @@
+import os
 WORKER = 30
 JOB_ROOT = "C:\\Users\\Bob Lin\\SynologyDrive\\Python Projects\\yahoo_spider\\stock_data_extractions\\"
 LOG_FORMATTER = '%(levelname)s:%(name)s:%(message)s'
@@ -16,4 +17,117 @@ UA_LIST = [
     "Mozilla/5.0 (Linux; Android 8.0.0;) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/79.0.3945.116 Mobile Safari/537.36",
     "Mozilla/5.0 (iPhone; CPU iPhone OS 12_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) CriOS/79.0.3945.73 Mobile/15E148 Safari/605.1",
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/87.0.4280.88 Safari/537.36"
-]
\ No newline at end of file
+]
+
+# keep-alive sessions per proxy route, one per worker thread, each holding a connection per host
+SESSION_POOL_SIZE = WORKER
+SESSION_POOL_HOSTS = 4
+# requests kept in flight by the asyncio extraction engine
+ASYNC_CONCURRENCY = 200
+# on-disk response cache for YahooAPIParser / YahooWebParser, TTL in seconds is matched on the url
+HTTP_CACHE_ENABLED = False
+HTTP_CACHE_PATH = os.path.join(JOB_ROOT, 'http_cache.sqlite')
+HTTP_CACHE_MAX_BYTES = 2 * 1024 ** 3
+HTTP_CACHE_TTL = {'quoteSummary': 6 * 3600,
+                  'fundamentals-timeseries': 24 * 3600,
+                  'finance/chart': 6 * 3600,
+                  'finance.yahoo.com/quote': 24 * 3600,
+                  'finance.yahoo.com/screener': 6 * 3600,
+                  'default': 3600}
+# ETag / Last-Modified of the pages fetched with conditional requests
+VALIDATOR_STORE_PATH = os.path.join(JOB_ROOT, 'http_validators.sqlite')
+# seconds each ticker took in the previous runs of a job, averaged with this weight on the latest run, used to
+# schedule the longest tasks first
+TASK_HISTORY_PATH = os.path.join(JOB_ROOT, 'task_history.sqlite')
+TASK_HISTORY_ALPHA = 0.5
+# query parameters that change on every call and must not be part of the cache key
+HTTP_CACHE_IGNORED_PARAMS = ['period2']
+# token bucket per host and proxy as (requests per second, burst), hosts not listed here are not limited
+RATE_LIMITS = {'query1.finance.yahoo.com': (20, 40),
+               'query2.finance.yahoo.com': (20, 40),
+               'finance.yahoo.com': (10, 20),
+               'finviz.com': (5, 10)}
+# responses that mean the host is throttling us, and the pause (seconds) when there is no Retry-After
+THROTTLE_STATUS = [429, 999]
+RATE_LIMIT_BACKOFF = 30
+# the rate never backs off below this fraction of the configured one
+RATE_LIMIT_MIN_FACTOR = 0.1
+# circuit breaker per host: consecutive failures that open it, seconds it stays open, trial requests when half-open
+CIRCUIT_FAILURE_THRESHOLD = 20
+CIRCUIT_COOLDOWN = 60
+CIRCUIT_HALF_OPEN_TRIALS = 3
+# days before the latest stored asOfDate that an incremental financial statement request starts from
+FINANCIAL_OVERLAP_DAYS = 120
+# bytes read at a time from a streamed page
+STREAM_CHUNK_SIZE = 64 * 1024
+# bytes still read from a streamed body closed part way, so that its connection can be kept alive; a longer remainder
+# is dropped with its connection
+STREAM_DRAIN_BYTES = 256 * 1024
+# endpoints the transfer statistics are broken down by, matched on the url in this order, otherwise the host
+TRANSFER_ENDPOINTS = ['quoteSummary', 'fundamentals-timeseries', 'finance/chart', 'finance/quote',
+                      'finance.yahoo.com/quote', 'finance.yahoo.com/screener', 'finviz.com/screener']
+
+# tasks kept in flight per worker by parallel_iter, so results are consumed while the rest are still running
+PARALLEL_WINDOW_PER_WORKER = 2
+
+# worker processes for CPU-bound jobs run on the process backend of parallel_process / parallel_iter, started with
+# spawn so that no worker inherits the open database connections of the parent
+PROCESS_WORKER = os.cpu_count() or 1
+PROCESS_START_METHOD = 'spawn'
+
+# seconds to open a connection and between two reads of a response, so a hung connection fails instead of blocking
+HTTP_CONNECT_TIMEOUT = 10
+HTTP_READ_TIMEOUT = 30
+# seconds a parallel task may run before the job stops waiting for it
+TASK_DEADLINE = 300
+# hedged requests: a request still waiting for its response after this quantile of the host's recent latencies gets
+# a duplicate on another proxy or connection and the first response wins; off unless HEDGE_REQUESTS
+HEDGE_REQUESTS = False
+HEDGE_QUANTILE = 0.95
+HEDGE_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+
+# staged extraction pipeline (util.pipeline): items buffered between two stages, and the parse and write workers
+# next to the WORKER fetch threads
+PIPELINE_QUEUE_SIZE = 2 * WORKER
+PIPELINE_PARSE_WORKERS = 4
+PIPELINE_WRITE_WORKERS = 2
+
+# shared database writer (util.batch_writer): a table is written once it buffers BATCH_WRITER_ROWS rows or its oldest
+# rows waited BATCH_WRITER_INTERVAL seconds, in statements of BATCH_WRITER_CHUNK_SIZE rows, and producers wait while
+# BATCH_WRITER_MAX_ROWS rows are buffered over all the tables
+BATCH_WRITER_ROWS = 5000
+BATCH_WRITER_INTERVAL = 5
+BATCH_WRITER_CHUNK_SIZE = 1000
+BATCH_WRITER_MAX_ROWS = 50000
+# connections the writer holds at once: its background thread, and the thread calling flush(), which writes the
+# buffers due at that time itself; a bulk load runs on the connection of the thread doing the write
+BATCH_WRITER_CONNECTIONS = 2
+
+# directory of the temporary TSV files loaded with LOAD DATA LOCAL INFILE (util.bulk_load), the system one if None
+BULK_LOAD_DIR = None
+
+# connections of the shared database engines (util.db_engine), one per thread that can hold one at the same time: the
+# WORKER threads (fetch stage or parallel_process, reads and unbuffered inserts or bulk loads), the pipeline write
+# workers, the batch writer and the main thread (population reads); parse workers never touch the database and each
+# process of a process backend has engines of its own. A checkout waiting longer than DB_POOL_SLOW_CHECKOUT seconds is
+# counted as waited, so a pool too small for the configured counts shows in pool_report()
+DB_POOL_SIZE = WORKER + PIPELINE_WRITE_WORKERS + BATCH_WRITER_CONNECTIONS + 1
+DB_POOL_MAX_OVERFLOW = 0
+DB_POOL_TIMEOUT = 30
+DB_POOL_SLOW_CHECKOUT = 0.01
+
+# unique keys of the tables written with insert_db(mode='ignore' / 'upsert'), which leave duplicate suppression to the
+# server: each must exist as a UNIQUE index on the table, which insert_db checks with SHOW INDEX before the first write
+# and, until migrate_unique_keys.py has added it, appends the rows instead with a warning
+TABLE_UNIQUE_KEYS = {'price': ['ticker', 'timestamp'],
+                     'yahoo_fundamental': ['ticker', 'updated_dt'],
+                     'yahoo_consensus': ['ticker', 'updated_dt'],
+                     'yahoo_annual_fundamental': ['ticker', 'asOfDate'],
+                     'yahoo_quarterly_fundamental': ['ticker', 'asOfDate'],
+                     'yahoo_trailing_fundamental': ['ticker', 'asOfDate'],
+                     'yahoo_etf_prices': ['ticker', 'updated_dt'],
+                     'yahoo_etf_3y5y10y_risk': ['ticker', 'updated_dt'],
+                     'yahoo_etf_holdings': ['ticker', 'updated_dt'],
+                     'yahoo_etf_trailing_returns': ['ticker', 'updated_dt'],
+                     'yahoo_etf_annual_returns': ['ticker', 'updated_dt', 'year']}
@@ -1,2 +1,11 @@
 PROXY_URL = '10.0.0.216'
-PROXY_PROT = '9050'
\ No newline at end of file
+PROXY_PROT = '9050'
+
+# proxies the requests are spread over (socks5:// or http://), eg. one per local Tor port
+PROXY_LIST = ['socks5://{}:{}'.format(PROXY_URL, PROXY_PROT)]
+# weight of the latest request in the latency and error rate averages of a proxy
+PROXY_EWMA_ALPHA = 0.2
+# a proxy whose error rate passes this, after at least PROXY_MIN_SAMPLES requests, is rested for PROXY_QUARANTINE seconds
+PROXY_MAX_ERROR_RATE = 0.5
+PROXY_MIN_SAMPLES = 10
+PROXY_QUARANTINE = 120
@@ -200,3 +200,52 @@ PRICE_TABLE_COLUMNS = ['ticker',
                        'regularMarketChangePercent',
                        'preMarketPrice',
                        'updated_dt']
+
+
+# YAHOO_STATS_COLUMNS that the multi-symbol quote endpoint (v7/finance/quote) returns for many symbols per call,
+# as column: (quote field, scale). The quote endpoint reports change percentages in percent, quoteSummary as a ratio
+YAHOO_QUOTE_COLUMNS = {'sharesOutstanding': ('sharesOutstanding', 1),
+                       'forwardPE': ('forwardPE', 1),
+                       'trailingPE': ('trailingPE', 1),
+                       'priceToBook': ('priceToBook', 1),
+                       'marketCap': ('marketCap', 1),
+                       'shortName': ('shortName', 1),
+                       'bookValue': ('bookValue', 1),
+                       'forwardEps': ('epsForward', 1),
+                       'trailingEps': ('epsTrailingTwelveMonths', 1),
+                       'fiftyDayAverage': ('fiftyDayAverage', 1),
+                       'twoHundredDayAverage': ('twoHundredDayAverage', 1),
+                       'fiftyTwoWeekHigh': ('fiftyTwoWeekHigh', 1),
+                       'fiftyTwoWeekLow': ('fiftyTwoWeekLow', 1),
+                       'averageDailyVolume10Day': ('averageDailyVolume10Day', 1),
+                       'averageVolume10days': ('averageDailyVolume10Day', 1),
+                       'averageDailyVolume3Month': ('averageDailyVolume3Month', 1),
+                       'averageVolume': ('averageDailyVolume3Month', 1),
+                       'regularMarketVolume': ('regularMarketVolume', 1),
+                       'volume': ('regularMarketVolume', 1),
+                       'regularMarketOpen': ('regularMarketOpen', 1),
+                       'open': ('regularMarketOpen', 1),
+                       'regularMarketPreviousClose': ('regularMarketPreviousClose', 1),
+                       'previousClose': ('regularMarketPreviousClose', 1),
+                       'regularMarketDayHigh': ('regularMarketDayHigh', 1),
+                       'dayHigh': ('regularMarketDayHigh', 1),
+                       'dayLow': ('regularMarketDayLow', 1),
+                       'regularMarketPrice': ('regularMarketPrice', 1),
+                       'currentPrice': ('regularMarketPrice', 1),
+                       'regularMarketChange': ('regularMarketChange', 1),
+                       'regularMarketChangePercent': ('regularMarketChangePercent', 0.01),
+                       'preMarketPrice': ('preMarketPrice', 1),
+                       'preMarketChange': ('preMarketChange', 1),
+                       'preMarketChangePercent': ('preMarketChangePercent', 0.01),
+                       'postMarketPrice': ('postMarketPrice', 1),
+                       'postMarketChange': ('postMarketChange', 1),
+                       'postMarketChangePercent': ('postMarketChangePercent', 0.01),
+                       'trailingAnnualDividendRate': ('trailingAnnualDividendRate', 1),
+                       'trailingAnnualDividendYield': ('trailingAnnualDividendYield', 1)}
+
+# symbols per quote call
+YAHOO_QUOTE_BATCH_SIZE = 250
+
+# quoteSummary modules still requested per ticker in batch quote mode, 'price' is fully covered by the quote
+# endpoint. An empty list skips the per-ticker calls and leaves the remaining columns empty
+YAHOO_STATS_FALLBACK_MODULES = ['defaultKeyStatistics', 'financialData', 'summaryDetail']
@@ -3,6 +3,8 @@ from modules.extract_etf_stats import YahooETF
 from util.transfer_data import UploadData2GCP
 from util.helper_functions import create_log
 from util.send_email import SendEmail
+from util.request_website import connection_stats, transfer_stats, transfer_report
+from util.db_engine import pool_report
 import datetime
 import time
 import sys
@@ -22,6 +24,8 @@ def DailyExtractions(runtime):
     sys.stderr.write(f"{'*' * 80}\n")
 
     # Call the Yahoo Statistics module
+    conn_start = connection_stats()
+    transfer_start = transfer_stats()
     stock_ext = YahooStats(runtime,
                            targeted_pop='YAHOO_STOCK_ALL',
                            batch=True,
@@ -29,12 +33,19 @@ def DailyExtractions(runtime):
                            use_tqdm=False,
                            test_size=None)
     stock_ext.run()
+    conn_end = connection_stats()
+    transfer_end = transfer_stats()
 
     SendEmail(content=f"""{'-'*80}\n"""
                       f'Daily Equity job finished for {runtime}\n'
                       f"""{'-'*80}\n"""
                       f"""{stock_ext.get_failed_extracts}/{stock_ext.no_of_stock} Failed Extractions. \n"""
+                      f"""{stock_ext.get_deferred_extracts} Deferred Extractions (circuit open). \n"""
                       f"""The job made {stock_ext.no_of_web_calls} calls through the internet. \n"""
+                      f"""Connections: {conn_end['new_connections'] - conn_start['new_connections']} opened, """
+                      f"""{conn_end['reused_connections'] - conn_start['reused_connections']} re-used. \n"""
+                      f"""{transfer_report(transfer_end, transfer_start)}"""
+                      f"""Database pools: {'; '.join(pool_report())}\n"""
                       f"""Target Table: yahoo_fundamental\n"""
                       f"""Target Population: YAHOO_STOCK_ALL\n"""
                       f"""Log: {loggerFileName}\n"""
@@ -52,6 +63,8 @@ def DailyExtractions(runtime):
     sys.stderr.write(f"{'*' * 80}\n")
 
     # Call the Yahoo ETF
+    conn_start = connection_stats()
+    transfer_start = transfer_stats()
     etf = YahooETF(runtime,
                    targeted_pop='YAHOO_ETF_ALL',
                    batch=True,
@@ -59,12 +72,19 @@ def DailyExtractions(runtime):
                    use_tqdm=False,
                    test_size=None)
     etf.run()
+    conn_end = connection_stats()
+    transfer_end = transfer_stats()
 
     SendEmail(content=f"""{'-'*80}\n"""
                       f'Daily ETF job finished for {runtime}\n'
                       f"""{'-'*80}\n"""
                       f"""{etf.get_failed_extracts}/{etf.no_of_stock} Failed Extractions. \n"""
+                      f"""{etf.get_deferred_extracts} Deferred Extractions (circuit open). \n"""
                       f"""The job made {etf.no_of_web_calls} calls through the internet. \n"""
+                      f"""Connections: {conn_end['new_connections'] - conn_start['new_connections']} opened, """
+                      f"""{conn_end['reused_connections'] - conn_start['reused_connections']} re-used. \n"""
+                      f"""{transfer_report(transfer_end, transfer_start)}"""
+                      f"""Database pools: {'; '.join(pool_report())}\n"""
                       f"""Target Table: yahoo_fundamental\n"""
                       f"""Target Population: YAHOO_STOCK_ALL\n"""
                       f"""Log: {loggerFileName}\n"""
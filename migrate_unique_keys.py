@@ -0,0 +1,63 @@
+"""
+    Adds the unique keys of jcfg.TABLE_UNIQUE_KEYS to the tables that do not have them yet, so that the jobs writing
+    with mode='ignore' / 'upsert' skip the rows stored already (until then insert_db appends them).
+
+    A table without duplicate keys gets the key with a plain ALTER TABLE. A table with duplicates is copied into a new
+    table carrying the key, keeping one row (any) of each key, and swapped in with RENAME TABLE; the original is kept
+    as <table>_dup_backup unless --drop-backup. Run it while no job writes to the database:
+
+        python migrate_unique_keys.py --db nas [--dry-run] [--drop-backup]
+"""
+import argparse
+from configs import job_configs as jcfg
+from util.db_engine import get_engine
+from util.helper_functions import create_log
+from util.insert_modes import has_unique_key, unique_key_ddl
+
+logger = create_log(loggerName='MigrateUniqueKeys')
+
+
+def duplicate_keys(conn, table) -> int:
+    names = ', '.join(f'`{column}`' for column in jcfg.TABLE_UNIQUE_KEYS[table])
+    return conn.exec_driver_sql(f'SELECT COUNT(*) FROM (SELECT 1 FROM `{table}` GROUP BY {names} '
+                                f'HAVING COUNT(*) > 1) AS d').scalar()
+
+
+def dedup_table(conn, table, drop_backup=False) -> None:
+    key = jcfg.TABLE_UNIQUE_KEYS[table][0]
+    conn.exec_driver_sql(f'DROP TABLE IF EXISTS `{table}_dedup`')
+    conn.exec_driver_sql(f'CREATE TABLE `{table}_dedup` LIKE `{table}`')
+    conn.exec_driver_sql(unique_key_ddl(table, f'{table}_dedup'))
+    # the no-op update keeps the first row of each key and, unlike INSERT IGNORE, still fails on bad values
+    conn.exec_driver_sql(f'INSERT INTO `{table}_dedup` SELECT * FROM `{table}` '
+                         f'ON DUPLICATE KEY UPDATE `{key}` = `{table}_dedup`.`{key}`')
+    conn.exec_driver_sql(f'RENAME TABLE `{table}` TO `{table}_dup_backup`, `{table}_dedup` TO `{table}`')
+    if drop_backup:
+        conn.exec_driver_sql(f'DROP TABLE `{table}_dup_backup`')
+
+
+def migrate(name='nas', dry_run=False, drop_backup=False) -> None:
+    con = get_engine(name)
+    for table in jcfg.TABLE_UNIQUE_KEYS:
+        if has_unique_key(con, table):
+            logger.info(f'{table}: unique key present')
+            continue
+        with con.begin() as conn:
+            duplicates = duplicate_keys(conn, table)
+            logger.info(f'{table}: {duplicates} keys stored more than once')
+            if dry_run:
+                continue
+            if duplicates:
+                dedup_table(conn, table, drop_backup)
+            else:
+                conn.exec_driver_sql(unique_key_ddl(table))
+        logger.info(f'{table}: unique key on {jcfg.TABLE_UNIQUE_KEYS[table]} added')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='add the unique keys of TABLE_UNIQUE_KEYS')
+    parser.add_argument('--db', default='nas', choices=['nas', 'prod'])
+    parser.add_argument('--dry-run', action='store_true', help='only count the duplicate keys')
+    parser.add_argument('--drop-backup', action='store_true', help='drop <table>_dup_backup after the swap')
+    args = parser.parse_args()
+    migrate(args.db, args.dry_run, args.drop_backup)
@@ -3,9 +3,12 @@ from configs import job_configs as jcfg
 import pandas as pd
 from util.helper_functions import create_log,unix_to_regular_time, dedup_list
 from util.get_stock_population import SetPopulation
-from util.parallel_process import parallel_process
-from util.request_website import YahooAPIParser
+from util.request_website import YahooAPIParser, CircuitOpenError, circuit_cooldown_remaining, \
+    SharedCounter
+from util.async_request_website import AsyncExtractionEngine
+from util.pipeline import Pipeline, Stage
 from util.database_management import DatabaseManagement
+from util.batch_writer import flush_batch_writer, PendingWrites
 
 
 class YahooETFExtractionError(Exception):
@@ -153,119 +156,105 @@ class YahooETF:
     yahoo_module = ['topHoldings', 'fundPerformance', 'price']
     BASE_URL = 'https://query2.finance.yahoo.com/v10/finance/quoteSummary/{stock}?modules=' + '%2C'.join(yahoo_module)
     workers = jcfg.WORKER
-
-    def __init__(self, updated_dt, targeted_pop, batch=False, loggerFileName=None, use_tqdm=True, test_size=None):
+    # ReadYahooETFStatData method and the table it is written to
+    ETF_SECTIONS = [('trailingReturns', 'yahoo_etf_trailing_returns'),
+                    ('riskOverviewStatistics', 'yahoo_etf_3y5y10y_risk'),
+                    ('topHoldings', 'yahoo_etf_holdings'),
+                    ('price', 'yahoo_etf_prices'),
+                    ('annualTotalReturns', 'yahoo_etf_annual_returns')]
+
+    def __init__(self, updated_dt, targeted_pop, batch=False, loggerFileName=None, use_tqdm=True, test_size=None,
+                 use_async=False):
         self.loggerFileName = loggerFileName
         self.updated_dt = updated_dt
         self.targeted_pop = targeted_pop
         self.batch = batch
+        self.use_async = use_async
         self.logger = create_log(loggerName='YahooETFStats', loggerFileName=self.loggerFileName)
         self.use_tqdm = use_tqdm
         self.test_size = test_size
         # list to store failed extractions
         self.failed_extract = []
+        # stocks skipped because the host circuit was open, they are retried in the next pass
+        self.deferred_extract = []
         # object variables for reporting purposes
         self.no_of_stock = 0
         self.time_decay = 0
-        self.no_of_web_calls = 0
-
-    @staticmethod
-    def _check_existing(stock, updated_dt, table, df_to_check):
-        sql = f"""
-                SELECT *
-                FROM {table}
-                WHERE ticker = '{stock}' and updated_dt = '{updated_dt}'
-            """
-        if df_to_check.empty:
-            return df_to_check
-
-        existing_df = DatabaseManagement(sql=sql).read_to_df()
-        existing_df.drop(columns=['data_id', 'updated_dt', 'ticker'], inplace=True)
+        # web calls are counted from many threads
+        self.web_calls = SharedCounter()
+        # rows handed to the batch writer, checked at the end of each pass
+        self.pending_writes = PendingWrites()
 
-        if existing_df.empty:
-            return df_to_check
-
-        df_diff = pd.concat([existing_df, df_to_check]).drop_duplicates(subset=None, keep=False, inplace=True)
-
-        if df_diff is None:
-            return pd.DataFrame
-        else:
-            return df_diff
+    def _stock_url(self, stock):
+        return self.BASE_URL.format(stock=stock)
 
-    def _get_etf_statistics(self, stock):
-        apiparse = YahooAPIParser(url=self.BASE_URL.format(stock=stock))
-        data = apiparse.parse()
-        self.no_of_web_calls = self.no_of_web_calls + apiparse.no_requests
+    def _fetch_etf_statistics(self, stock, _):
+        apiparse = YahooAPIParser(url=self._stock_url(stock))
+        try:
+            data = apiparse.parse()
+        finally:
+            self.web_calls.add(apiparse.no_requests)
+        if data is None:
+            raise YahooETFExtractionError('unable to get yahoo API data')
+        return data
+
+    def _parse_etf_statistics(self, stock, data) -> dict:
         # read data from Yahoo API
         etfdataobj = ReadYahooETFStatData(data)
+        frames = {}
+        for section, table in self.ETF_SECTIONS:
+            try:
+                frames[table] = getattr(etfdataobj, section)()
+            except YahooETFExtractionError:
+                self.logger.debug(f"{stock}: {section} extraction failed")
+                self.failed_extract.append(stock)
+        return frames
+
+    def _write_etf_statistics(self, stock, frames) -> None:
+        for table, df in frames.items():
+            if not df.empty:
+                df['ticker'] = stock
+                df['updated_dt'] = self.updated_dt
+                # rows stored by an earlier run of the day are skipped on their unique key
+                self.pending_writes.add(stock, DatabaseManagement(data_df=df, table=table, insert_index=False,
+                                                                  buffered=True, mode='ignore').insert_db())
+
+    def _collect_writes(self):
+        for line in flush_batch_writer():
+            self.logger.info(f"Writer {line}")
+        written, failed = set(), {}
+        for stock, rows, e in self.pending_writes.collect():
+            written.add(stock)
+            if e is not None:
+                failed[stock] = e
+        for stock in written:
+            if stock in failed:
+                self.logger.debug(f"{stock}: write failed, {failed[stock]}")
+                self.failed_extract.append(stock)
+            else:
+                self.logger.info(f"{stock}: processed successfully")
 
-        try:
-            trailingReturns = etfdataobj.trailingReturns()
-            trailingReturns = self._check_existing(stock, self.updated_dt, 'yahoo_etf_trailing_returns', trailingReturns)
-            if not trailingReturns.empty:
-                trailingReturns['ticker'] = stock
-                trailingReturns['updated_dt'] = self.updated_dt
-
-                DatabaseManagement(data_df=trailingReturns,
-                                   table='yahoo_etf_trailing_returns',
-                                   insert_index=False).insert_db()
-        except YahooETFExtractionError:
-            self.logger.debug(f"{stock}: trailingReturns extraction failed")
-            self.failed_extract.append(stock)
-
-        try:
-            riskOverviewStatistics = etfdataobj.riskOverviewStatistics()
-            riskOverviewStatistics = self._check_existing(stock, self.updated_dt, 'yahoo_etf_3y5y10y_risk', riskOverviewStatistics)
-            if not riskOverviewStatistics.empty:
-                riskOverviewStatistics['ticker'] = stock
-                riskOverviewStatistics['updated_dt'] = self.updated_dt
-                DatabaseManagement(data_df=riskOverviewStatistics,
-                                   table='yahoo_etf_3y5y10y_risk',
-                                   insert_index=False).insert_db()
-        except YahooETFExtractionError:
-            self.logger.debug(f"{stock}: riskOverviewStatistics extraction failed")
-            self.failed_extract.append(stock)
-
-        try:
-            topHoldings = etfdataobj.topHoldings()
-            topHoldings = self._check_existing(stock, self.updated_dt, 'yahoo_etf_holdings', topHoldings)
-            if not topHoldings.empty:
-                topHoldings['ticker'] = stock
-                topHoldings['updated_dt'] = self.updated_dt
-                DatabaseManagement(data_df=topHoldings,
-                                   table='yahoo_etf_holdings',
-                                   insert_index=False).insert_db()
-        except YahooETFExtractionError:
-            self.logger.debug(f"{stock}: topHoldings extraction failed")
-            self.failed_extract.append(stock)
-
-        try:
-            price = etfdataobj.price()
-            price = self._check_existing(stock, self.updated_dt, 'yahoo_etf_prices', price)
-            if not price.empty:
-                price['ticker'] = stock
-                price['updated_dt'] = self.updated_dt
-                DatabaseManagement(data_df=price,
-                                   table='yahoo_etf_prices',
-                                   insert_index=False).insert_db()
-        except YahooETFExtractionError:
-            self.logger.debug(f"{stock}: price extraction failed")
+    def _process_etf_statistics(self, stock, data):
+        # handler for the asyncio engine, which has already fetched the JSON
+        if data is None:
+            self.logger.debug(f"{stock}: unable to get yahoo API data")
             self.failed_extract.append(stock)
+            return None
+        self._write_etf_statistics(stock, self._parse_etf_statistics(stock, data))
 
-        try:
-            annualreturn = etfdataobj.annualTotalReturns()
-            annualreturn = self._check_existing(stock, self.updated_dt, 'yahoo_etf_annual_returns', annualreturn)
-            if not annualreturn.empty:
-                annualreturn['ticker'] = stock
-                annualreturn['updated_dt'] = self.updated_dt
-                DatabaseManagement(data_df=annualreturn,
-                                   table='yahoo_etf_annual_returns',
-                                   insert_index=False).insert_db()
-        except YahooETFExtractionError:
-            self.logger.debug(f"{stock}: yahoo_etf_annual_returns extraction failed")
+    def _pipeline_error(self, stage, stock, e):
+        if isinstance(e, CircuitOpenError):
+            self.logger.debug(f"{stock}: deferred, {e}")
+            self.deferred_extract.append(stock)
+        else:
+            self.logger.debug(f"{stock}: {stage} failed, {e}")
             self.failed_extract.append(stock)
 
-        self.logger.info(f"{stock}: processed successfully")
+    def _pipeline(self, workers) -> Pipeline:
+        return Pipeline([Stage('fetch', self._fetch_etf_statistics, workers, deadline=jcfg.TASK_DEADLINE),
+                         Stage('parse', self._parse_etf_statistics, min(workers, jcfg.PIPELINE_PARSE_WORKERS)),
+                         Stage('write', self._write_etf_statistics, min(workers, jcfg.PIPELINE_WRITE_WORKERS))],
+                        on_error=self._pipeline_error, use_tqdm=self.use_tqdm)
 
     def run(self):
         start = time.time()
@@ -278,14 +267,25 @@ class YahooETF:
         self.no_of_stock = len(stocks)
 
         for _ in range(3):
+            if self.deferred_extract:
+                # let the open circuits go half-open before retrying the deferred stocks
+                time.sleep(circuit_cooldown_remaining())
+            self.deferred_extract = []
             self.logger.info(f"{'*'*40}1st Run{'*'*40}")
-            if self.batch:
-                parallel_process(stocks, self._get_etf_statistics, n_jobs=self.workers, use_tqdm=self.use_tqdm)
+            if self.use_async:
+                engine = AsyncExtractionEngine(proxy=True, n_jobs=self.workers)
+                engine.run(stocks, self._stock_url, self._process_etf_statistics, use_tqdm=self.use_tqdm)
+                self.web_calls.add(engine.no_requests)
+                self.deferred_extract.extend(engine.deferred)
             else:
-                parallel_process(stocks, self._get_etf_statistics, n_jobs=1, use_tqdm=self.use_tqdm)
+                pipeline = self._pipeline(self.workers if self.batch else 1).run(stocks)
+                for line in pipeline.report():
+                    self.logger.info(f"Pipeline {line}")
+            # stocks whose rows the writer failed to insert are retried with the others
+            self._collect_writes()
 
             self.logger.info(f"{'*'*40}2rd Run{'*'*40}")
-            stocks = dedup_list(self.failed_extract)
+            stocks = dedup_list(self.failed_extract + self.deferred_extract)
             self.failed_extract = []
 
         end = time.time()
@@ -296,11 +296,20 @@ class YahooETF:
     def get_failed_extracts(self):
         return len(self.failed_extract)
 
+    @property
+    def no_of_web_calls(self):
+        return self.web_calls.value
+
+    @property
+    def get_deferred_extracts(self):
+        return len(self.deferred_extract)
+
 
 if __name__ == '__main__':
     obj = YahooETF('2022-04-12',
                    targeted_pop='YAHOO_ETF_ALL',
-                   batch=True,
+                   batch=False,
                    loggerFileName=None,
-                   use_tqdm=True)
-    obj._get_etf_statistics('BND')
+                   use_tqdm=False,
+                   test_size=1)
+    obj.run()
@@ -5,7 +5,7 @@ from factors.growth_factors import *
 from factors.pmo_factors import *
 from configs import job_configs as jcfg
 from util.helper_functions import create_log
-from util.parallel_process import parallel_process
+from util.parallel_process import parallel_iter, TaskTimings
 from datetime import date
 import time
 import os
@@ -13,7 +13,10 @@ from util.gcp_functions import upload_to_bucket
 from util.create_output_sqls import write_insert_db
 from util.get_stock_population import SetPopulation
 from util.database_management import DatabaseManagement, DatabaseManagementError
+from util.batch_writer import flush_batch_writer, PendingWrites
 from util.helper_functions import returnNotMatches, dedupe_dataframe
+from util.single_flight import SingleFlight
+from util.task_history import TaskHistory
 
 pd.set_option('mode.chained_assignment', None)
 pd.set_option('display.max_columns', None)
@@ -23,6 +26,51 @@ class FactorCalculationError(Exception):
     pass
 
 
+# the market index series, downloaded once per (symbol, start_dt, end_dt) and shared by every stock
+market_series = SingleFlight()
+
+
+def load_market_series(symbol, start_dt, end_dt) -> pd.DataFrame:
+    market_f = YahooPrice(symbol, start_dt, end_dt, disable_log=True).get_basic_stock_price()
+    if market_f.empty:
+        # not memoized, so the next stock tries the download again
+        raise FactorCalculationError(f"No price history for the market index {symbol}")
+    market_f.drop(columns=['ticker'], axis=1, inplace=True)
+    market_f.index.names = ['asOfDate']
+    return dedupe_dataframe(market_f)
+
+
+# the date dimension between start_dt and updated_dt, read once and shared by every stock
+time_dimension = SingleFlight()
+
+
+def load_time_dimension(start_dt, end_dt) -> pd.DataFrame:
+    time_d = DatabaseManagement(table='date_d',
+                                key='fulldate as asOfDate ,dayofweek',
+                                where=f"fulldate>='{start_dt}' and fulldate<='{end_dt}'").get_record()
+    time_d['asOfDate'] = pd.to_datetime(time_d['asOfDate'], format='%Y-%m-%d', errors='ignore')
+    time_d.set_index('asOfDate', inplace=True)
+    return time_d
+
+
+def init_factor_worker(start_dt, updated_dt, market_f=None, time_d=None):
+    """
+        Seed the shared market series and date dimension of a worker process with the frames loaded by the parent,
+        so each worker neither downloads ^GSPC nor reads date_d again.
+    """
+    if market_f is not None:
+        market_series.get((CalculateFactors.market, start_dt, updated_dt), lambda: market_f)
+    if time_d is not None:
+        time_dimension.get((start_dt, updated_dt), lambda: time_d)
+
+
+def run_stock_pipeline(loaded):
+    stock, each_stock = loaded
+    if isinstance(each_stock, Exception):
+        raise each_stock
+    return each_stock.last_weekly_entry, each_stock.run_pipeline()
+
+
 class CalculateFactors:
     market = '^GSPC'  # use sp500 as the market index
 
@@ -54,18 +102,15 @@ class CalculateFactors:
             self.price_f.drop(columns=['ticker'], axis=1, inplace=True)
             self.price_f = dedupe_dataframe(self.price_f)
 
-        self.market_f = YahooPrice(self.market, start_dt, updated_dt, disable_log=True).get_basic_stock_price()
-        if not self.market_f.empty:
-            self.market_f.drop(columns=['ticker'], axis=1, inplace=True)
-            self.market_f.index.names = ['asOfDate']
-            self.market_f = dedupe_dataframe(self.market_f)
+        # shared with the other stocks, so it must not be modified in place
+        try:
+            self.market_f = market_series.get((self.market, start_dt, updated_dt),
+                                              lambda: load_market_series(self.market, start_dt, updated_dt))
+        except FactorCalculationError:
+            self.market_f = pd.DataFrame()
 
         # read time dimension data
-        self.time_d = DatabaseManagement(table='date_d',
-                                         key='fulldate as asOfDate ,dayofweek',
-                                         where=f"fulldate>='{self.start_dt}' and fulldate<='{self.updated_dt}'").get_record()
-        self.time_d['asOfDate'] = pd.to_datetime(self.time_d['asOfDate'], format='%Y-%m-%d', errors='ignore')
-        self.time_d.set_index('asOfDate', inplace=True)
+        self.time_d = time_dimension.get((start_dt, updated_dt), lambda: load_time_dimension(start_dt, updated_dt))
 
         # read quarterly fundamental data
         self.quarterly_data = DatabaseManagement(key='*',
@@ -92,6 +137,22 @@ class CalculateFactors:
         self.loggerFileName = loggerFileName
         self.logger = create_log(loggerName='factors', loggerFileName=self.loggerFileName)
 
+    def __getstate__(self):
+        # the shared frames are not sent to a worker process, which has them preloaded by init_factor_worker
+        state = self.__dict__.copy()
+        del state['market_f'], state['time_d']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        try:
+            self.market_f = market_series.get((self.market, self.start_dt, self.updated_dt),
+                                              lambda: load_market_series(self.market, self.start_dt, self.updated_dt))
+        except FactorCalculationError:
+            self.market_f = pd.DataFrame()
+        self.time_d = time_dimension.get((self.start_dt, self.updated_dt),
+                                         lambda: load_time_dimension(self.start_dt, self.updated_dt))
+
     def run_pipeline(self):
 
         if self.price_f.empty or self.price_f.empty:
@@ -194,7 +255,8 @@ class FactorJob:
     workers = jcfg.WORKER
     no_of_db_entries = 0
 
-    def __init__(self, start_dt, updated_dt, targeted_table, targeted_pop, batch_run=True, loggerFileName=None, use_tqdm=True):
+    def __init__(self, start_dt, updated_dt, targeted_table, targeted_pop, batch_run=True, loggerFileName=None, use_tqdm=True,
+                 backend='process'):
         # init the input
         self.updated_dt = updated_dt
         self.start_dt = start_dt
@@ -210,29 +272,50 @@ class FactorJob:
         self.loggerFileName = loggerFileName
         self.logger = create_log(loggerName='factor_calc', loggerFileName=self.loggerFileName)
         self.use_tqdm = use_tqdm
+        # 'process' runs run_pipeline on PROCESS_WORKER cores, 'thread' keeps everything on the worker threads
+        self.backend = backend
+        # rows handed to the batch writer, checked once the writer is flushed
+        self.pending_writes = PendingWrites()
 
     def _calculate_final_pop(self):
         return returnNotMatches(self.stock_list,
                                 self.existing_list + jcfg.BLOCK)
 
-    def _run_each_stock(self, stock):
-        each_stock = CalculateFactors(stock=stock,
-                                      start_dt=self.start_dt,
-                                      updated_dt=self.updated_dt,
-                                      loggerFileName=self.loggerFileName)
+    def _load_each_stock(self, stock):
+        return CalculateFactors(stock=stock,
+                                start_dt=self.start_dt,
+                                updated_dt=self.updated_dt,
+                                loggerFileName=self.loggerFileName)
+
+    def _calculate_each_stock(self, stock):
+        return run_stock_pipeline((stock, self._load_each_stock(stock)))
+
+    def _preloaded(self):
         try:
-            stock_df = each_stock.run_pipeline()
-            if stock_df.empty:
-                self.logger.debug(f"Failed:Processing stock = {stock} due to the dataframe is empty, "
-                                  f"last date as {each_stock.last_weekly_entry}")
-            else:
-                try:
-                    DatabaseManagement(data_df=stock_df, table=self.targeted_table, insert_index=True).insert_db()
-                    self.logger.info(f"Success: Entered stock = {stock}, last date as {each_stock.last_weekly_entry}")
-                except DatabaseManagementError as e:
-                    self.logger.debug(f"Failed: Entering stock = {stock} as {e}")
-        except Exception as e:
-            self.logger.debug(f"failed to calculate factors for stock {stock} as {e}")
+            market_f = market_series.get((CalculateFactors.market, self.start_dt, self.updated_dt),
+                                         lambda: load_market_series(CalculateFactors.market, self.start_dt,
+                                                                    self.updated_dt))
+        except FactorCalculationError:
+            market_f = None
+        time_d = time_dimension.get((self.start_dt, self.updated_dt),
+                                    lambda: load_time_dimension(self.start_dt, self.updated_dt))
+        return self.start_dt, self.updated_dt, market_f, time_d
+
+    def _write_each_stock(self, stock, result):
+        if isinstance(result, Exception):
+            self.logger.debug(f"failed to calculate factors for stock {stock} as {result}")
+            return
+        last_weekly_entry, stock_df = result
+        if stock_df.empty:
+            self.logger.debug(f"Failed:Processing stock = {stock} due to the dataframe is empty, "
+                              f"last date as {last_weekly_entry}")
+        else:
+            try:
+                self.pending_writes.add((stock, last_weekly_entry),
+                                        DatabaseManagement(data_df=stock_df, table=self.targeted_table,
+                                                           insert_index=True, buffered=True).insert_db())
+            except DatabaseManagementError as e:
+                self.logger.debug(f"Failed: Entering stock = {stock} as {e}")
 
     def _write_sql_output(self):
         self.logger.info(f"{'-'*10}Start generate SQL outputs{'-'*10}")
@@ -250,10 +333,38 @@ class FactorJob:
     def job(self):
         stock_list = self._calculate_final_pop()
         print(f'There are {len(stock_list)} stocks to be extracted')
-        if self.batch_run:
-            parallel_process(stock_list, self._run_each_stock, self.workers, use_tqdm=self.use_tqdm)
+        history = TaskHistory('factor_job')
+        load_timings, calc_timings = TaskTimings(), TaskTimings()
+        if self.batch_run and self.backend == 'process':
+            # prices and fundamentals are read on threads, the pandas work is spread over the cores
+            loaded = parallel_iter(stock_list, self._load_each_stock, self.workers, use_tqdm=False,
+                                   cost=history.estimates(), timings=load_timings, deadline=jcfg.TASK_DEADLINE)
+            calculated = ((stock, result) for (stock, _), result in
+                          parallel_iter(loaded, run_stock_pipeline, jcfg.PROCESS_WORKER, use_tqdm=self.use_tqdm,
+                                        backend='process', initializer=init_factor_worker,
+                                        initargs=self._preloaded(), timings=calc_timings,
+                                        key=lambda loaded_stock: loaded_stock[0]))
         else:
-            parallel_process(stock_list, self._run_each_stock, 1, use_tqdm=self.use_tqdm)
+            calculated = parallel_iter(stock_list, self._calculate_each_stock, self.workers if self.batch_run else 1,
+                                       use_tqdm=self.use_tqdm, cost=history.estimates(), timings=calc_timings)
+        # written here as each stock completes
+        for stock, result in calculated:
+            self._write_each_stock(stock, result)
+        history.update({stock: load_timings.durations.get(stock, 0) + seconds
+                        for stock, seconds in calc_timings.durations.items()})
+        if load_timings.durations:
+            self.logger.info(f"Loading: {load_timings.report()}")
+        self.logger.info(f"Calculation: {calc_timings.report()}")
+        self.logger.info(f"Market index series: {market_series.loads} downloads, {market_series.hits} shared")
+        # the SQL output is read back from the table
+        for line in flush_batch_writer():
+            self.logger.info(f"Writer {line}")
+        for (stock, last_weekly_entry), rows, e in self.pending_writes.collect():
+            if e is None:
+                self.no_of_db_entries += rows
+                self.logger.info(f"Success: Entered stock = {stock}, last date as {last_weekly_entry}")
+            else:
+                self.logger.debug(f"Failed: Entering stock = {stock} as {e}")
 
     def run(self):
         start = time.time()
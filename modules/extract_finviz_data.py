@@ -5,6 +5,7 @@ import time
 from util.helper_functions import create_log
 from util.request_website import FinvizParserPerPage
 from util.database_management import DatabaseManagement, DatabaseManagementError
+from util.batch_writer import flush_batch_writer, PendingWrites
 from util.parallel_process import parallel_process
 
 
@@ -23,6 +24,8 @@ class Finviz:
         self.existing_data.set_index(['ticker'], inplace=True)
         self.logger = create_log(loggerName='Finviz', loggerFileName=self.loggerFileName)
         self.use_tqdm = use_tqdm
+        # rows handed to the batch writer by page
+        self.pending_writes = PendingWrites()
 
     def finviz_url_builder(self, page_num):
         url_opt = '&c=' + ','.join(str(i) for i in range(1, 71))
@@ -52,13 +55,14 @@ class Finviz:
             self.logger.debug(f"data is empty for page={page_num}")
             return None
         try:
-            DatabaseManagement(data_df=stock_df[fcfg.FINVIZ_TICKERS],
-                               table='finviz_tickers',
-                               insert_index=True).insert_db()
-            DatabaseManagement(data_df=stock_df[fcfg.FINVIZ_SCREENER],
-                               table='finviz_screener',
-                               insert_index=True).insert_db()
-            self.logger.info(f'data process successfully for page={page_num} ')
+            self.pending_writes.add(page_num, DatabaseManagement(data_df=stock_df[fcfg.FINVIZ_TICKERS],
+                                                                 table='finviz_tickers',
+                                                                 insert_index=True,
+                                                                 buffered=True).insert_db())
+            self.pending_writes.add(page_num, DatabaseManagement(data_df=stock_df[fcfg.FINVIZ_SCREENER],
+                                                                 table='finviz_screener',
+                                                                 insert_index=True,
+                                                                 buffered=True).insert_db())
         except DatabaseManagementError as e:
             self.logger.debug(f'data process error for page={page_num} as {e}')
 
@@ -73,6 +77,18 @@ class Finviz:
     def run(self):
         start = time.time()
         self.parse_all_pages()
+        for line in flush_batch_writer():
+            self.logger.info(f"Writer {line}")
+        # the first error of each page, None when both its tables were written
+        pages = {}
+        for page_num, rows, e in self.pending_writes.collect():
+            if pages.get(page_num) is None:
+                pages[page_num] = e
+        for page_num, e in pages.items():
+            if e is None:
+                self.logger.info(f'data process successfully for page={page_num} ')
+            else:
+                self.logger.debug(f'data process error for page={page_num} as {e}')
         end = time.time()
         self.logger.info("Job took {} minutes".format(round((end - start) / 60)))
 
@@ -2,8 +2,10 @@ from configs import job_configs as jcfg
 from util.helper_functions import create_log
 from util.parallel_process import parallel_process
 from util.helper_functions import dedup_list, returnNotMatches
-from util.request_website import YahooAPIParser
+from util.request_website import YahooAPIParser, CircuitOpenError, circuit_cooldown_remaining, SharedCounter
+from util.async_request_website import AsyncExtractionEngine
 from util.database_management import DatabaseManagement
+from util.batch_writer import flush_batch_writer, PendingWrites
 from util.get_stock_population import SetPopulation
 import pandas as pd
 from datetime import date
@@ -102,10 +104,12 @@ class YahooAnalysis:
     url = "https://query1.finance.yahoo.com/v10/finance/quoteSummary/{ticker}?modules=earningsTrend%2CearningsHistory"
     failed_extract = []
 
-    def __init__(self, updated_dt, targeted_pop, batch_run=True, loggerFileName=None, use_tqdm=True, test_size=None):
+    def __init__(self, updated_dt, targeted_pop, batch_run=True, loggerFileName=None, use_tqdm=True, test_size=None,
+                 use_async=False):
         self.updated_dt = updated_dt
         self.targeted_pop = targeted_pop
         self.batch_run = batch_run
+        self.use_async = use_async
         self.loggerFileName = loggerFileName
         self.logger = create_log(loggerName='yahoo_analysis', loggerFileName=self.loggerFileName)
         self.existing_rec = DatabaseManagement(table='yahoo_consensus',
@@ -116,13 +120,18 @@ class YahooAnalysis:
         # object variables for reporting purposes
         self.no_of_stock = 0
         self.time_decay = 0
-        self.no_of_web_calls = 0
+        # web calls are counted from many threads
+        self.web_calls = SharedCounter()
+        # rows handed to the batch writer, checked at the end of each pass
+        self.pending_writes = PendingWrites()
+        # stocks skipped because the host circuit was open, they are retried in the next pass
+        self.deferred_extract = []
 
-    def _get_analysis_data(self, stock):
+    def _stock_url(self, stock):
+        return self.url.format(ticker=stock)
+
+    def _read_analysis_data(self, stock, data):
         try:
-            apiparse = YahooAPIParser(url=self.url.format(ticker=stock), proxy=True)
-            data = apiparse.parse()
-            self.no_of_web_calls = self.no_of_web_calls + apiparse.no_requests
             out_df = ReadYahooAnalysisData(data).parse()
             out_df['ticker'] = stock
             return out_df
@@ -131,19 +140,53 @@ class YahooAnalysis:
             self.failed_extract.append(stock)
             return pd.DataFrame()
 
-    def _run_each_stock(self, stock):
-        self.logger.info(f"Start Processing stock = {stock}")
-        stock_df = self._get_analysis_data(stock)
+    def _get_analysis_data(self, stock):
+        try:
+            apiparse = YahooAPIParser(url=self._stock_url(stock), proxy=True)
+            data = apiparse.parse()
+            self.web_calls.add(apiparse.no_requests)
+        except CircuitOpenError as e:
+            self.logger.debug(f"Deferred stock = {stock}, {e}")
+            self.deferred_extract.append(stock)
+            return None
+        except Exception as e:
+            self.logger.debug(e)
+            self.failed_extract.append(stock)
+            return pd.DataFrame()
+        return self._read_analysis_data(stock, data)
+
+    def _insert_analysis_data(self, stock, stock_df):
         if stock_df.empty:
             self.logger.debug(f"Failed:Processing stock = {stock} due to the dataframe is empty")
         else:
             stock_df['updated_dt'] = self.updated_dt
             try:
-                DatabaseManagement(data_df=stock_df, table='yahoo_consensus').insert_db()
-                self.logger.info(f"Success: Entered stock = {stock}")
+                self.pending_writes.add(stock, DatabaseManagement(data_df=stock_df, table='yahoo_consensus',
+                                                                  buffered=True, mode='ignore').insert_db())
             except Exception as e:
                 self.logger.debug(f"Failed: Entering stock = {stock}, due to {e}")
 
+    def _collect_writes(self):
+        for line in flush_batch_writer():
+            self.logger.info(f"Writer {line}")
+        for stock, rows, e in self.pending_writes.collect():
+            if e is None:
+                self.logger.info(f"Success: Entered stock = {stock}")
+            else:
+                self.logger.debug(f"Failed: Entering stock = {stock}, due to {e}")
+                self.failed_extract.append(stock)
+
+    def _run_each_stock(self, stock):
+        self.logger.info(f"Start Processing stock = {stock}")
+        stock_df = self._get_analysis_data(stock)
+        if stock_df is not None:
+            self._insert_analysis_data(stock, stock_df)
+
+    def _run_each_stock_from_json(self, stock, data):
+        # handler for the asyncio engine, which has already fetched the JSON
+        self.logger.info(f"Start Processing stock = {stock}")
+        self._insert_analysis_data(stock, self._read_analysis_data(stock, data))
+
     def run_job(self):
         start = time.time()
         stocks = SetPopulation(self.targeted_pop).setPop()
@@ -158,12 +201,23 @@ class YahooAnalysis:
 
         self.logger.info(f'There are {self.no_of_stock} stocks to be extracted')
         for _ in range(3):
+            if self.deferred_extract:
+                # let the open circuits go half-open before retrying the deferred stocks
+                time.sleep(circuit_cooldown_remaining())
+            self.deferred_extract = []
             self.logger.info(f"{'-' * 20}Start Extraction{'-' * 20}")
-            if self.batch_run:
+            if self.use_async:
+                engine = AsyncExtractionEngine(proxy=True, n_jobs=self.workers)
+                engine.run(stock_list, self._stock_url, self._run_each_stock_from_json, use_tqdm=self.use_tqdm)
+                self.web_calls.add(engine.no_requests)
+                self.deferred_extract.extend(engine.deferred)
+            elif self.batch_run:
                 parallel_process(stock_list, self._run_each_stock, n_jobs=self.workers, use_tqdm=self.use_tqdm)
             else:
                 parallel_process(stock_list, self._run_each_stock, n_jobs=1)
-            stock_list = dedup_list(self.failed_extract)
+            # stocks whose rows the writer failed to insert are retried with the others
+            self._collect_writes()
+            stock_list = dedup_list(self.failed_extract + self.deferred_extract)
             self.failed_extract = []
             self.logger.info(f"{'-' * 20} Extract Ends{'-' * 20}")
         end = time.time()
@@ -173,6 +227,14 @@ class YahooAnalysis:
     def get_failed_extracts(self):
         return len(self.failed_extract)
 
+    @property
+    def no_of_web_calls(self):
+        return self.web_calls.value
+
+    @property
+    def get_deferred_extracts(self):
+        return len(self.deferred_extract)
+
 
 if __name__ == '__main__':
     obj = YahooAnalysis(updated_dt=date.today(),
@@ -2,19 +2,40 @@ import sys
 import time
 import pandas as pd
 import numpy as np
-from util.helper_functions import dedup_list, create_log
+from util.helper_functions import dedup_list, create_log, regular_time_to_unix
 import configs.job_configs as jcfg
 import datetime
-from util.parallel_process import parallel_process
-from util.request_website import YahooAPIParser
+from util.parallel_process import longest_first, TaskTimings
+from util.pipeline import Pipeline, Stage
+from util.task_history import TaskHistory
+from util.request_website import YahooAPIParser, WebParseError, CircuitOpenError, circuit_cooldown_remaining, \
+    SharedCounter
+from util.async_request_website import AsyncExtractionEngine
 from util.database_management import DatabaseManagement, DatabaseManagementError
+from util.batch_writer import flush_batch_writer, PendingWrites
 from util.get_stock_population import SetPopulation
+from util.single_flight import SingleFlight
+from util.existing_keys import ExistingKeys
 
 
 class ExtractionError(Exception):
     pass
 
 
+# the statement elements requested from Yahoo, read once per process when the first url is built
+statement_elements = SingleFlight()
+
+
+def load_statement_elements() -> list:
+    return DatabaseManagement(sql="""SELECT type, freq, data
+                                    FROM `yahoo_financial_statement_data_control`""").read_to_df().data.values.tolist()
+
+
+def parse_financial_statements(stock, js):
+    # module level so that the parse stage can run in worker processes
+    return ReadYahooFinancialData(js).parse()
+
+
 class ReadYahooFinancialData:
     def __init__(self, js):
         self.js = js
@@ -74,74 +95,132 @@ class ReadYahooFinancialData:
 class YahooFinancial:
     workers = jcfg.WORKER
     BASE_URL = 'https://query1.finance.yahoo.com'
-    df_for_elements = DatabaseManagement(sql="""SELECT type, freq, data
-                                            FROM `yahoo_financial_statement_data_control`""").read_to_df()
-    all_elements = df_for_elements.data.values.tolist()
-    no_of_requests = 0
     no_of_db_entries = 0
     table_lookup = {'yahoo_quarterly_fundamental': 'quarter',
                     'yahoo_annual_fundamental': 'annual',
                     'yahoo_trailing_fundamental': 'ttm'}
     failed_extract = []
+    # 1985-08-22, the start of the full history
+    FULL_HISTORY_PERIOD1 = 493590046
 
-    def __init__(self, updated_dt, targeted_pop, batch=False, loggerFileName=None, use_tqdm=True):
+    def __init__(self, updated_dt, targeted_pop, batch=False, loggerFileName=None, use_tqdm=True, use_async=False,
+                 incremental=False, parse_backend='thread'):
         self.updated_dt = updated_dt
         self.targeted_population = targeted_pop
         self.loggerFileName = loggerFileName
         self.batch = batch
+        self.use_async = use_async
+        # 'process' parses the statements in worker processes instead of threads
+        self.parse_backend = parse_backend
+        # only request statements after the latest stored asOfDate of each stock
+        self.incremental = incremental
+        self.latest_as_of = {}
+        # stocks whose full history was requested and written completely before (with the seconds the request took),
+        # only those are requested incrementally: a statement type they have nothing stored in has none on Yahoo
+        self.full_history = TaskHistory('yahoo_financial_full')
+        self.fetched_full = set()
+        # stocks requested with the full history in the current pass
+        self.requested_full = set()
         self.logger = create_log(loggerName='YahooFinancialStatements', loggerFileName=self.loggerFileName)
         self.use_tqdm = use_tqdm
         # object variables for reporting purposes
         self.no_of_stock = 0
         self.time_decay = 0
-        self.no_of_web_calls = 0
-        # number of database entries
+        # web calls are counted from many threads
+        self.web_calls = SharedCounter()
+        # number of rows written to the database
         self.data_entries = 0
+        # rows handed to the batch writer by (stock, table), checked at the end of each pass
+        self.pending_writes = PendingWrites()
+        # stocks skipped because the host circuit was open, they are retried in the next pass
+        self.deferred_extract = []
+        # seconds per stock in the previous runs, incremental requests are much shorter so they are kept apart
+        self.task_history = TaskHistory('yahoo_financial_incremental' if incremental else 'yahoo_financial')
 
     def _existing_dt(self) -> None:
-        annual_data = DatabaseManagement(table='yahoo_annual_fundamental',
-                                         key="ticker, asOfDate, 'annual' as type",
-                                         where="1=1").get_record()
-
-        quarter_data = DatabaseManagement(table='yahoo_quarterly_fundamental',
-                                          key="ticker, asOfDate, 'quarter' as type",
-                                          where="1=1").get_record()
-
-        ttm_data = DatabaseManagement(table='yahoo_trailing_fundamental',
-                                      key="ticker, asOfDate, 'ttm' as type",
-                                      where="1=1").get_record()
-
-        self.ext_list_data = pd.concat([annual_data, quarter_data, ttm_data], axis=0)
-        self.ext_list_data['asOfDate'] = pd.to_datetime(self.ext_list_data['asOfDate'])
-
-    def _url_builder_fundamentals(self) -> str:
+        self.existing_keys = ExistingKeys()
+        for table, key_type in self.table_lookup.items():
+            existing = DatabaseManagement(table=table, key='ticker, asOfDate', where="1=1").get_record()
+            self.existing_keys.add(key_type, existing['ticker'], existing['asOfDate'])
+        self.logger.info(f"Existing entries: {self.existing_keys.rows} dates over {len(self.existing_keys)} "
+                         f"(type, ticker) keys, {self.existing_keys.nbytes / 1024 ** 2:.1f}MB")
+
+        # the stock is only complete up to the table it was last updated in the least
+        self.latest_as_of = self.existing_keys.latest_by_ticker()
+        self.fetched_full = set(self.full_history.estimates())
+
+    def _url_builder_fundamentals(self, period1=FULL_HISTORY_PERIOD1) -> str:
         tdk = str(int(time.mktime(datetime.datetime.now().timetuple())))
         yahoo_fundamental_url = '/ws/fundamentals-timeseries/v1/finance/timeseries/{stock}?symbol={stock}&type='
-        yahoo_fundamental_url_tail = '&merge=false&period1=493590046&period2=' + tdk
-        elements = '%2C'.join(self.all_elements)
+        yahoo_fundamental_url_tail = f'&merge=false&period1={period1}&period2=' + tdk
+        elements = '%2C'.join(statement_elements.get('elements', load_statement_elements))
 
         return self.BASE_URL + yahoo_fundamental_url + elements + yahoo_fundamental_url_tail
 
+    def _period1(self, stock) -> int:
+        latest = self.latest_as_of.get(stock)
+        if not self.incremental or stock not in self.fetched_full or latest is None or pd.isna(latest):
+            # new stocks, and stocks never written with their full history, get the full history
+            self.requested_full.add(stock)
+            return self.FULL_HISTORY_PERIOD1
+        start = (latest - pd.Timedelta(days=jcfg.FINANCIAL_OVERLAP_DAYS)).date()
+        return max(self.FULL_HISTORY_PERIOD1, regular_time_to_unix(start))
+
+    def _stock_url(self, stock) -> str:
+        return self._url_builder_fundamentals(self._period1(stock)).format(stock=stock)
+
     def _extract_api(self, stock) -> dict:
-        url = self._url_builder_fundamentals().format(stock=stock)
-        apiparse = YahooAPIParser(url=url)
-        data = apiparse.parse()
-        self.no_of_requests = self.no_of_requests + apiparse.no_requests
+        url = self._stock_url(stock)
+        apiparse = YahooAPIParser(url=url, stream_path='timeseries.result')
+        try:
+            data = apiparse.parse()
+        except CircuitOpenError:
+            raise
+        except WebParseError as e:
+            self.logger.debug(f'unable to get yahoo API data for stock={stock} as {e}')
+            data = None
+        finally:
+            self.web_calls.add(apiparse.no_requests)
         if data is None:
             self.logger.debug(f'unable to get yahoo API data for stock={stock}')
         else:
             return data
 
-    def _extract_each_stock(self, stock) -> None:
+    def _fetch_each_stock(self, stock, _) -> dict:
         self.logger.info(f"Processing {stock} for fundamental data")
         js = self._extract_api(stock)
+        if js is None:
+            raise ExtractionError(f'no fundamental data for stock={stock}')
+        return js
+
+    def _write_each_stock(self, stock, frames) -> None:
+        self._insert_frames(stock, *frames)
+
+    def _pipeline_error(self, stage, stock, e) -> None:
+        if isinstance(e, CircuitOpenError):
+            self.logger.debug(f"Deferred stock = {stock}, {e}")
+            self.deferred_extract.append(stock)
+        else:
+            self.logger.debug(f"Failed to {stage} stock = {stock} as {e}")
+            self.failed_extract.append(stock)
+
+    def _pipeline(self, workers, timings) -> Pipeline:
+        return Pipeline([Stage('fetch', self._fetch_each_stock, workers, timings=timings,
+                               deadline=jcfg.TASK_DEADLINE),
+                         Stage('parse', parse_financial_statements, min(workers, jcfg.PIPELINE_PARSE_WORKERS),
+                               backend=self.parse_backend),
+                         Stage('write', self._write_each_stock, min(workers, jcfg.PIPELINE_WRITE_WORKERS))],
+                        on_error=self._pipeline_error, use_tqdm=self.use_tqdm)
+
+    def _process_each_stock(self, stock, js) -> None:
         if js is None:
             self.failed_extract.append(stock)
             return None
 
         # extract data from YAHOO JSON
-        df_12m, df_3m, df_ttm = ReadYahooFinancialData(js).parse()
+        self._insert_frames(stock, *ReadYahooFinancialData(js).parse())
 
+    def _insert_frames(self, stock, df_12m, df_3m, df_ttm) -> None:
         self._insert_to_db(df_12m, stock, 'yahoo_annual_fundamental')
         self._insert_to_db(df_3m, stock, 'yahoo_quarterly_fundamental')
         self._insert_to_db(df_ttm, stock, 'yahoo_trailing_fundamental')
@@ -151,19 +230,36 @@ class YahooFinancial:
         df_to_insert['updated_dt'] = self.updated_dt
         df_to_insert = self._check_existing_entries_financial(df_to_check=df_to_insert, stock=stock, table=table)
         try:
-            DatabaseManagement(data_df=df_to_insert, table=table, insert_index=True).insert_db()
-            self.data_entries += 1
-            self.logger.info(f"{stock} data entered to {table} successfully")
+            # a stock retried after a failed write has its other tables written again, skipped on the unique key
+            self.pending_writes.add((stock, table), DatabaseManagement(data_df=df_to_insert, table=table,
+                                                                       insert_index=True, buffered=True,
+                                                                       bulk_load=True, mode='ignore').insert_db())
         except DatabaseManagementError as e:
             self.logger.debug(f"Failed to insert data for stock={stock} as {e}")
 
+    def _collect_writes(self) -> None:
+        for line in flush_batch_writer():
+            self.logger.info(f"Writer {line}")
+        for (stock, table), rows, e in self.pending_writes.collect():
+            if e is None:
+                self.data_entries += rows
+                self.logger.info(f"{stock} data entered to {table} successfully")
+            else:
+                self.logger.debug(f"Failed to insert data for stock={stock} as {e}")
+                self.failed_extract.append(stock)
+
+    def _record_full_history(self, durations) -> None:
+        # after _collect_writes: the full history requests of the pass that were written completely
+        failed = set(self.failed_extract + self.deferred_extract)
+        done = {stock: durations.get(stock, 0.0) for stock in self.requested_full if stock not in failed}
+        self.full_history.update(done)
+        self.fetched_full.update(done)
+        self.requested_full = set()
+
     def _check_existing_entries_financial(self, df_to_check, stock, table) -> pd.DataFrame:
-        df_existing_data = self.ext_list_data[
-            (self.ext_list_data['type'] == self.table_lookup[table]) &
-            (self.ext_list_data['ticker'] == stock)]
-        df_existing_data.set_index(['ticker', 'asOfDate'], inplace=True)
-        df_after_check = df_to_check[~df_to_check.index.isin(df_existing_data.index)]
-        return df_after_check
+        existing = self.existing_keys.isin(self.table_lookup[table], stock,
+                                           df_to_check.index.get_level_values('asOfDate'))
+        return df_to_check[~existing]
 
     def run(self) -> None:
         start = time.time()
@@ -173,13 +269,29 @@ class YahooFinancial:
         self.no_of_stock = len(stocks)
 
         for _ in range(3):
+            timings = TaskTimings()
+            if self.deferred_extract:
+                # let the open circuits go half-open before retrying the deferred stocks
+                time.sleep(circuit_cooldown_remaining())
+            self.deferred_extract = []
             self.logger.info(f"{'-'*20}Start Extraction{'-'*20}")
-            if self.batch:
-                parallel_process(stocks, self._extract_each_stock, n_jobs=self.workers, use_tqdm=self.use_tqdm)
+            if self.use_async:
+                engine = AsyncExtractionEngine(proxy=True, n_jobs=self.workers)
+                engine.run(stocks, self._stock_url, self._process_each_stock, use_tqdm=self.use_tqdm)
+                self.web_calls.add(engine.no_requests)
+                self.deferred_extract.extend(engine.deferred)
             else:
-                parallel_process(stocks, self._extract_each_stock, n_jobs=1)
-
-            stocks = self.failed_extract
+                # longest fetches first
+                ordered = [stocks[i] for i in longest_first(stocks, self.task_history.estimates())]
+                pipeline = self._pipeline(self.workers if self.batch else 1, timings).run(ordered)
+                self.task_history.update(timings.durations)
+                for line in pipeline.report():
+                    self.logger.info(f"Pipeline {line}")
+            # stocks whose rows the writer failed to insert are retried with the others
+            self._collect_writes()
+            self._record_full_history(timings.durations)
+
+            stocks = dedup_list(self.failed_extract + self.deferred_extract)
             self.failed_extract = []
             self.logger.info(f"{'-'*20}Extract Ends{'-'*20}")
 
@@ -191,6 +303,14 @@ class YahooFinancial:
     def get_failed_extracts(self):
         return len(self.failed_extract)
 
+    @property
+    def no_of_web_calls(self):
+        return self.web_calls.value
+
+    @property
+    def get_deferred_extracts(self):
+        return len(self.deferred_extract)
+
 
 if __name__ == '__main__':
     spider = YahooFinancial(datetime.datetime.today().date() - datetime.timedelta(days=-3),
@@ -1,4 +1,4 @@
-from util.request_website import YahooWebParser, WebParseError
+from util.request_website import YahooWebParser, WebParseError, NotModified, SharedCounter
 from util.get_stock_population import SetPopulation
 from util.parallel_process import parallel_process
 from util.database_management import DatabaseManagement
@@ -22,6 +22,8 @@ class ExtractProfile:
         self.logger = create_log(loggerName=f'ExtractProfile', loggerFileName=self.loggerFileName)
         self.population = SetPopulation(self.population).setPop()
         self.output_df = pd.DataFrame()
+        # profiles answered with 304, they are neither parsed nor written again
+        self.not_modified = SharedCounter()
         self.existing = DatabaseManagement(table='yahoo_universe_profile',
                                            key='ticker',
                                            where=f"updated_dt = '{self.updated_dt}'").get_record().ticker.to_list()
@@ -29,8 +31,13 @@ class ExtractProfile:
     def get_profile_each_stock(self, stock):
         url = self.BASE_URL.format(ticker=stock)
         js = None
+        parser = YahooWebParser(url=url, proxy=self.proxy, conditional=True)
         try:
-            js = YahooWebParser(url=url, proxy=self.proxy).parse()
+            js = parser.parse()
+        except NotModified:
+            self.not_modified.add()
+            self.logger.debug(f"{stock} profile is not modified")
+            return None
         except WebParseError as e:
             self.logger.debug(e)
 
@@ -49,6 +56,7 @@ class ExtractProfile:
                                                 }, index=[0])
 
                 DatabaseManagement(data_df=df, table='yahoo_universe_profile', insert_index=False).insert_db()
+                parser.commit_validators()
         except:
             self.logger.info(f"Unable to extract {stock}")
 
@@ -62,6 +70,7 @@ class ExtractProfile:
             raise ExtractProfileError(f"Population is empty, check if it were valid.")
         else:
             parallel_process(final_pop, self.get_profile_each_stock, n_jobs=30, use_tqdm=True)
+            self.logger.info(f"{self.not_modified.value} profiles were not modified")
 
 
 if __name__ == '__main__':
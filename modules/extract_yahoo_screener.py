@@ -1,8 +1,9 @@
-from util.request_website import YahooWebParser
+from util.request_website import YahooWebParser, NotModified, SharedCounter
 from util.helper_functions import create_log
 from util.parallel_process import parallel_process
 from util.database_management import DatabaseManagement
 import pandas as pd
+import json
 from datetime import date
 
 class ExtractScreenerError(Exception):
@@ -19,19 +20,42 @@ class ExtractScreener:
         self.proxy = proxy
         # output_df is used to receive results
         self.output_df = pd.DataFrame()
+        # pages answered with 304 are read from the rows stored with their validators
+        self.not_modified = SharedCounter()
+        self.pending_validators = []
         self.loggerFileName = loggerFileName
         self.logger = create_log(loggerName=f'ExtractScreener-{self.token}', loggerFileName=self.loggerFileName)
 
     def create_url(self, offset):
         return self.base_url.format(token=self.token, offset=offset)
 
+    def _get_page(self, url) -> dict:
+        parser = YahooWebParser(url=url, proxy=self.proxy, conditional=True)
+        try:
+            js = parser.parse()
+        except NotModified as e:
+            if e.payload is not None:
+                self.not_modified.add()
+                return json.loads(e.payload)
+            parser = YahooWebParser(url=url, proxy=self.proxy)
+            js = parser.parse()
+        try:
+            results = js['context']['dispatcher']['stores']['ScreenerResultsStore']['results']
+            page = {'rows': [{col: row.get(col) for col in self.keep_col} for row in results['rows']],
+                    'total': results['total']}
+        except Exception:
+            raise ExtractScreenerError(f"Failed to extract data from {url}")
+        # the validators are stored once the snapshot is written
+        self.pending_validators.append((parser, json.dumps(page).encode()))
+        return page
+
     def parse_results_from_each_page(self, offset):
         url = self.create_url(offset)
         self.logger.info(f'Processing {url}')
-        js = YahooWebParser(url=url, proxy=self.proxy).parse()
+        page = self._get_page(url)
         try:
-            rows = js['context']['dispatcher']['stores']['ScreenerResultsStore']['results']['rows']
-            total = js['context']['dispatcher']['stores']['ScreenerResultsStore']['results']['total']
+            rows = page['rows']
+            total = page['total']
             if len(rows) > 0:
                 df = pd.DataFrame.from_records(rows)[self.keep_col]
                 df['offset'] = offset
@@ -72,6 +96,9 @@ class ExtractScreener:
         DatabaseManagement(data_df=self.output_df,
                            table='yahoo_universe',
                            insert_index=False).insert_db()
+        for parser, payload in self.pending_validators:
+            parser.commit_validators(payload)
+        self.logger.info(f'{self.not_modified.value} pages were not modified')
 
 
 if __name__ == "__main__":
@@ -1,51 +1,43 @@
 from configs import yahoo_configs as ycfg
 from datetime import date
-import json
 import pandas as pd
 import numpy as np
 import time
 from dataclasses import dataclass
+from urllib.parse import quote
 from util.get_stock_population import SetPopulation
 from util.helper_functions import create_log
 from util.helper_functions import unix_to_regular_time
 from util.helper_functions import dedup_list
 from util.helper_functions import returnNotMatches
 from util.parallel_process import *
-from util.request_website import YahooAPIParser
+from util.request_website import YahooAPIParser, CircuitOpenError, circuit_cooldown_remaining, SharedCounter
+from util.async_request_website import AsyncExtractionEngine
+from util.pipeline import Pipeline, Stage
 from util.database_management import DatabaseManagement, DatabaseManagementError
+from util.batch_writer import flush_batch_writer, PendingWrites
 
 
 @dataclass
 class ReadYahooStatsData:
     data: dict
+    # the quoteSummary modules that were requested, every one of them must be in the response
+    modules: tuple = ('defaultKeyStatistics', 'financialData', 'summaryDetail', 'price')
 
     def parse(self) -> pd.DataFrame:
 
-        # defaultKeyStatistics
-        json_data = json.dumps(self.data['quoteSummary']['result'][0]['defaultKeyStatistics'])
-        defaultKeyStatistics = pd.read_json(json_data).transpose()
-        defaultKeyStatistics.drop(['fmt', 'longFmt'], axis=1, inplace=True, errors='ignore')
+        row = {}
+        for module in self.modules:
+            for key, value in self.data['quoteSummary']['result'][0][module].items():
+                # a field in more than one module keeps its first value
+                if key in row:
+                    continue
+                if isinstance(value, dict):
+                    value = value.get('raw')
+                row[key] = np.nan if value is None else value
 
-        # financialData
-        json_data = json.dumps(self.data['quoteSummary']['result'][0]['financialData'])
-        financialData = pd.read_json(json_data).transpose()
-        financialData.drop(['fmt', 'longFmt'], axis=1, inplace=True, errors='ignore')
-
-        # summaryDetail
-        json_data = json.dumps(self.data['quoteSummary']['result'][0]['summaryDetail'])
-        summaryDetail = pd.read_json(json_data).transpose()
-        summaryDetail.drop(['fmt', 'longFmt'], axis=1, inplace=True, errors='ignore')
-
-        # price
-        json_data = json.dumps(self.data['quoteSummary']['result'][0]['price'])
-        price = pd.read_json(json_data).transpose()
-        price.drop(['fmt', 'longFmt'], axis=1, inplace=True, errors='ignore')
-
-        final_df = pd.concat([defaultKeyStatistics, financialData, summaryDetail, price])
-
-        # remove the duplicated columns
-        final_df = final_df.transpose()
-        final_df = final_df.loc[:, ~final_df.columns.duplicated()]
+        # with no modules every column comes from the batch quote
+        final_df = pd.DataFrame([row], index=[0])
 
         for col in ycfg.YAHOO_STATS_COLUMNS:
             if col in final_df.columns:
@@ -67,58 +59,148 @@ class ReadYahooStatsData:
         return final_df
 
 
+@dataclass
+class ReadYahooQuoteData:
+    quote: dict
+
+    def parse(self) -> dict:
+        # one result of the multi-symbol quote endpoint, mapped onto YAHOO_STATS_COLUMNS
+        out = {}
+        for col, (field, scale) in ycfg.YAHOO_QUOTE_COLUMNS.items():
+            value = self.quote.get(field)
+            if value is not None:
+                out[col] = value * scale if scale != 1 else value
+        return out
+
+
 class YahooStats:
     yahoo_module = ['defaultKeyStatistics', 'financialData', 'summaryDetail', 'price']
-    BASE_URL = 'https://query1.finance.yahoo.com/v10/finance/quoteSummary/{stock}?modules='+'%2C'.join(yahoo_module)
+    SUMMARY_URL = 'https://query1.finance.yahoo.com/v10/finance/quoteSummary/{stock}?modules={modules}'
+    QUOTE_URL = 'https://query1.finance.yahoo.com/v7/finance/quote?symbols={symbols}'
     workers = jcfg.WORKER
     failed_extract = []
 
-    def __init__(self, updated_dt: date, targeted_pop: str, batch=False, loggerFileName=None, use_tqdm=True, test_size=None):
+    def __init__(self, updated_dt: date, targeted_pop: str, batch=False, loggerFileName=None, use_tqdm=True, test_size=None,
+                 use_async=False, batch_quote=False):
         self.loggerFileName = loggerFileName
         self.updated_dt = updated_dt
         self.targeted_pop = targeted_pop
         self.batch = batch
+        self.use_async = use_async
+        # fill the columns the quote endpoint has from batched calls, quoteSummary only for the rest
+        self.batch_quote = batch_quote
+        self.quotes = {}
         self.logger = create_log(loggerName='YahooStats', loggerFileName=self.loggerFileName)
         self.use_tqdm = use_tqdm
         self.test_size = test_size
         # object variables for reporting purposes
         self.no_of_stock = 0
         self.time_decay = 0
-        self.no_of_web_calls = 0
+        # web calls are counted from many threads
+        self.web_calls = SharedCounter()
+        # stocks skipped because the host circuit was open, they are retried in the next pass
+        self.deferred_extract = []
+        # rows handed to the batch writer, checked at the end of each pass
+        self.pending_writes = PendingWrites()
 
-    def _get_stock_statistics(self, stock) -> pd.DataFrame:
+    def _get_quote_chunk(self, symbols) -> None:
+        url = self.QUOTE_URL.format(symbols=quote(','.join(symbols), safe=','))
         try:
-            # parse the Yahoo API, it returns a JSON and a class variable of number of website calls
-            apiparse = YahooAPIParser(url=self.BASE_URL.format(stock=stock))
+            apiparse = YahooAPIParser(url=url)
             data = apiparse.parse()
-            self.no_of_web_calls = self.no_of_web_calls + apiparse.no_requests
-            out_df = ReadYahooStatsData(data).parse()
-            out_df['lastDividendDate'] = unix_to_regular_time(out_df['lastDividendDate'])
-            out_df['exDividendDate'] = unix_to_regular_time(out_df['exDividendDate'])
-            out_df['lastSplitDate'] = unix_to_regular_time(out_df['lastSplitDate'])
-            out_df['ticker'] = stock
-            out_df['updated_dt'] = self.updated_dt
-            return out_df
-
+            self.web_calls.add(apiparse.no_requests)
+            for result in data['quoteResponse']['result']:
+                self.quotes[result['symbol']] = result
         except Exception as e:
-            self.logger.error("Fail to extract stock = {}, error: {}".format(stock, e))
-            return pd.DataFrame()
+            # the stocks of this chunk fall back to the full quoteSummary call
+            self.logger.error(f"Fail to extract batch quote for {symbols[0]}..{symbols[-1]}, error: {e}")
+
+    def _get_batch_quotes(self, stocks) -> None:
+        size = ycfg.YAHOO_QUOTE_BATCH_SIZE
+        chunks = [stocks[i:i + size] for i in range(0, len(stocks), size)]
+        parallel_process(chunks, self._get_quote_chunk, n_jobs=self.workers if self.batch else 1, front_num=0,
+                         use_tqdm=self.use_tqdm)
+        self.logger.info(f"Batch quotes: {len(self.quotes)}/{len(stocks)} stocks from {len(chunks)} calls")
+
+    def _stock_modules(self, stock) -> list:
+        if self.batch_quote and stock in self.quotes:
+            return ycfg.YAHOO_STATS_FALLBACK_MODULES
+        return self.yahoo_module
+
+    def _stock_url(self, stock) -> str:
+        return self.SUMMARY_URL.format(stock=stock, modules='%2C'.join(self._stock_modules(stock)))
+
+    def _read_stock_statistics(self, stock, data) -> pd.DataFrame:
+        out_df = ReadYahooStatsData(data, tuple(self._stock_modules(stock))).parse()
+        if stock in self.quotes:
+            for col, value in ReadYahooQuoteData(self.quotes[stock]).parse().items():
+                out_df[col] = value
+        out_df['lastDividendDate'] = unix_to_regular_time(out_df['lastDividendDate'])
+        out_df['exDividendDate'] = unix_to_regular_time(out_df['exDividendDate'])
+        out_df['lastSplitDate'] = unix_to_regular_time(out_df['lastSplitDate'])
+        out_df['ticker'] = stock
+        out_df['updated_dt'] = self.updated_dt
+        return out_df
+
+    def _fetch_stock_statistics(self, stock, _):
+        if not self._stock_modules(stock):
+            # fully covered by the batch quote
+            return None
+        # parse the Yahoo API, it returns a JSON and a class variable of number of website calls
+        apiparse = YahooAPIParser(url=self._stock_url(stock))
+        try:
+            return apiparse.parse()
+        finally:
+            self.web_calls.add(apiparse.no_requests)
+
+    def _pipeline_error(self, stage, stock, e) -> None:
+        if isinstance(e, CircuitOpenError):
+            self.logger.debug("Deferred stock = {}, {}".format(stock, e))
+            self.deferred_extract.append(stock)
+        else:
+            self.logger.error("Fail to extract stock = {} at {}, error: {}".format(stock, stage, e))
+            self.failed_extract.append(stock)
+
+    def _pipeline(self, workers) -> Pipeline:
+        return Pipeline([Stage('fetch', self._fetch_stock_statistics, workers, deadline=jcfg.TASK_DEADLINE),
+                         Stage('parse', self._read_stock_statistics, min(workers, jcfg.PIPELINE_PARSE_WORKERS)),
+                         Stage('write', self._insert_stock_statistics, min(workers, jcfg.PIPELINE_WRITE_WORKERS))],
+                        on_error=self._pipeline_error, use_tqdm=self.use_tqdm)
 
-    def _extract_each_stock(self, stock) -> None:
-        data_df = self._get_stock_statistics(stock)
+    def _insert_stock_statistics(self, stock, data_df) -> None:
         if data_df.empty:
             self.logger.debug('Fail to find {} data after {} trails'.format(stock, 5))
             self.failed_extract.append(stock)
         # enter yahoo fundamental table
         try:
-            DatabaseManagement(data_df=data_df[ycfg.YAHOO_STATS_COLUMNS], table='yahoo_fundamental').insert_db()
-            self.logger.info("yahoo_fundamental: Yahoo statistics data entered successfully for stock = {}".format(stock))
+            self.pending_writes.add(stock, DatabaseManagement(data_df=data_df[ycfg.YAHOO_STATS_COLUMNS],
+                                                              table='yahoo_fundamental',
+                                                              buffered=True, mode='ignore').insert_db())
         except (DatabaseManagementError, KeyError) as e:
             self.logger.error(f"yahoo_fundamental: Yahoo statistics data entered failed for stock = {stock}, {e}")
             self.failed_extract.append(stock)
 
         return None
 
+    def _collect_writes(self) -> None:
+        for line in flush_batch_writer():
+            self.logger.info(f"Writer {line}")
+        for stock, rows, e in self.pending_writes.collect():
+            if e is None:
+                self.logger.info(f"yahoo_fundamental: Yahoo statistics data entered successfully for stock = {stock}")
+            else:
+                self.logger.error(f"yahoo_fundamental: Yahoo statistics data entered failed for stock = {stock}, {e}")
+                self.failed_extract.append(stock)
+
+    def _extract_each_stock_from_json(self, stock, data) -> None:
+        # handler for the asyncio engine, which has already fetched the JSON
+        try:
+            data_df = self._read_stock_statistics(stock, data)
+        except Exception as e:
+            self.logger.error("Fail to extract stock = {}, error: {}".format(stock, e))
+            data_df = pd.DataFrame()
+        self._insert_stock_statistics(stock, data_df)
+
     def _existing_stock_list(self) -> pd.DataFrame:
         return DatabaseManagement(table='yahoo_fundamental',
                                   key='ticker',
@@ -140,15 +222,32 @@ class YahooStats:
 
         self.no_of_stock = len(stocks)
 
+        if self.batch_quote:
+            self._get_batch_quotes(stocks)
+
         for _ in range(3):
+            if self.deferred_extract:
+                # let the open circuits go half-open before retrying the deferred stocks
+                time.sleep(circuit_cooldown_remaining())
+            self.deferred_extract = []
             self.logger.info(f"{'-'*20}Start Extraction{'-'*20}")
-            if self.batch:
-                parallel_process(stocks, self._extract_each_stock, n_jobs=self.workers, use_tqdm=self.use_tqdm)
+            if self.use_async:
+                engine = AsyncExtractionEngine(proxy=True, n_jobs=self.workers)
+                engine.run([stock for stock in stocks if self._stock_modules(stock)],
+                           self._stock_url, self._extract_each_stock_from_json, use_tqdm=self.use_tqdm)
+                self.web_calls.add(engine.no_requests)
+                self.deferred_extract.extend(engine.deferred)
+                # stocks fully covered by the batch quote do not need a request
+                self._pipeline(1).run([stock for stock in stocks if not self._stock_modules(stock)])
             else:
-                parallel_process(stocks, self._extract_each_stock, n_jobs=1)
-            stocks = dedup_list(self.failed_extract)
+                pipeline = self._pipeline(self.workers if self.batch else 1).run(stocks)
+                for line in pipeline.report():
+                    self.logger.info(f"Pipeline {line}")
+            # stocks whose rows the writer failed to insert are retried with the others
+            self._collect_writes()
+            stocks = dedup_list(self.failed_extract + self.deferred_extract)
             self.failed_extract = []
-            self.logger.info(f"{'-'*20}Extract Ends{'-'*20}")
+            self.logger.info(f"{'-'*20}Extract Ends, {len(self.deferred_extract)} deferred{'-'*20}")
 
         end = time.time()
         self.time_decay = round((end - start) / 60)
@@ -157,6 +256,14 @@ class YahooStats:
     def get_failed_extracts(self):
         return len(self.failed_extract)
 
+    @property
+    def no_of_web_calls(self):
+        return self.web_calls.value
+
+    @property
+    def get_deferred_extracts(self):
+        return len(self.deferred_extract)
+
 
 if __name__ == '__main__':
     spider = YahooStats(date(9999, 4, 20),
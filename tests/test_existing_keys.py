@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+from util.existing_keys import ExistingKeys
+
+
+def _keys():
+    keys = ExistingKeys()
+    keys.add('annual', ['AAA', 'AAA', 'BBB'], ['2021-12-31', '2022-12-31', '2022-12-31'])
+    keys.add('quarter', ['AAA', 'BBB'], ['2023-03-31', '2023-03-31'])
+    keys.add('ttm', ['AAA'], ['2023-03-31'])
+    return keys
+
+
+def test_isin():
+    keys = _keys()
+    assert keys.isin('annual', 'AAA', ['2021-12-31', '2020-12-31']).tolist() == [True, False]
+    assert not keys.isin('ttm', 'BBB', ['2023-03-31']).any()
+    assert keys.rows == 6 and len(keys) == 5
+
+
+def test_latest_by_ticker_takes_the_least_up_to_date_type():
+    latest = _keys().latest_by_ticker()
+    assert latest['AAA'] == pd.Timestamp('2022-12-31')
+    # only the types stored for a ticker count
+    assert latest['BBB'] == pd.Timestamp('2022-12-31')
+
+
+def test_nat_dates_are_dropped():
+    keys = ExistingKeys()
+    keys.add('annual', ['AAA', 'AAA'], [pd.NaT, '2022-12-31'])
+    assert keys.rows == 1
+    assert keys.isin('annual', 'AAA', np.array(['2022-12-31'], dtype='datetime64[D]')).all()
@@ -0,0 +1,186 @@
+import asyncio
+import time
+import random
+import concurrent.futures
+from tqdm import tqdm
+from configs import job_configs as jcfg
+from urllib.parse import urlsplit
+from urllib3.util.request import ACCEPT_ENCODING
+from util.request_website import WebParseError, WebThrottledError, CircuitOpenError, get_circuit_breaker, \
+    record_transfer
+from util import json_decoder
+from util.rate_limiter import get_rate_limiter, parse_retry_after
+from util.proxy_pool import get_proxy_pool
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    from aiohttp_socks import ProxyConnector, ProxyError, ProxyConnectionError, ProxyTimeoutError
+    PROXY_ERRORS = (ProxyError, ProxyConnectionError, ProxyTimeoutError)
+except ImportError:
+    ProxyConnector = None
+    PROXY_ERRORS = ()
+
+
+class AsyncYahooAPIParser:
+    def __init__(self, url, sessions, proxy_pool=None):
+        self.url = url
+        # one session per proxy url, keyed None when there is no proxy
+        self.sessions = sessions
+        self.proxy_pool = proxy_pool
+        self.no_requests = 0
+        self.status = None
+
+    async def _parse_for_json(self):
+        host = urlsplit(self.url).hostname
+        breaker = get_circuit_breaker(host)
+        breaker.before_request()
+        proxy_url = self.proxy_pool.acquire() if self.proxy_pool is not None else None
+        start = time.monotonic()
+        self.status = None
+        try:
+            return await self._request(host, breaker, proxy_url)
+        finally:
+            if self.proxy_pool is not None:
+                # the host throttles the exit address, so a throttled proxy counts as failing
+                self.proxy_pool.release(proxy_url, time.monotonic() - start,
+                                        ok=self.status is not None and self.status not in jcfg.THROTTLE_STATUS)
+
+    async def _request(self, host, breaker, proxy_url):
+        limiter = get_rate_limiter(host, proxy_url)
+        if limiter is not None:
+            # the token bucket blocks, so wait for it off the event loop
+            await asyncio.get_running_loop().run_in_executor(None, limiter.acquire)
+        self.no_requests += 1
+        try:
+            async with self.sessions[proxy_url].get(self.url, allow_redirects=False) as resp:
+                self.status = resp.status
+                if resp.status >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if limiter is not None:
+                    if resp.status in jcfg.THROTTLE_STATUS:
+                        limiter.throttled(parse_retry_after(resp.headers.get('Retry-After')))
+                    else:
+                        limiter.succeeded()
+                if resp.status == 200:
+                    body = await resp.read()
+                    # aiohttp decompresses as it reads, the wire size is only known from Content-Length
+                    record_transfer(self.url, int(resp.headers.get('Content-Length', len(body))), len(body))
+                    try:
+                        return json_decoder.loads(body)
+                    except json_decoder.JSONDecodeError as e:
+                        raise WebParseError(f'unable to decode the response of {self.url} due to {e}')
+                elif resp.status in jcfg.THROTTLE_STATUS:
+                    raise WebThrottledError(f'Response status code is {resp.status} for {self.url}')
+                raise WebParseError(f'Response status code is {resp.status} for {self.url}')
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) + PROXY_ERRORS as e:
+            breaker.record_failure()
+            raise WebParseError(f'unable to parse url = {self.url} due to {e}')
+
+    async def parse(self):
+        for trail in range(5):
+            try:
+                js = await self._parse_for_json()
+            except WebThrottledError:
+                if trail == 4:
+                    raise
+                continue
+            if js is not None:
+                return js
+        return None
+
+
+class AsyncExtractionEngine:
+    """
+        Fetch Yahoo API urls on one event loop and hand the JSON to the extractor's handler.
+
+        Up to `concurrency` requests are kept in flight by a semaphore, while `function(element, js)` runs on a
+        pool of `n_jobs` threads so pandas parsing and database inserts do not block the event loop.
+        `js` is None when the fetch failed, so the handler can record the failure. Elements whose host circuit
+        is open are not handed to the handler but collected in `deferred`.
+
+        Args:
+            proxy (boolean, default=True): spread the requests over the proxies in prox_configs.PROXY_LIST
+            concurrency (int): the number of requests in flight
+            n_jobs (int): the number of threads that run the handler
+    """
+
+    def __init__(self, proxy=True, concurrency=jcfg.ASYNC_CONCURRENCY, n_jobs=jcfg.WORKER):
+        if aiohttp is None:
+            raise ImportError('the asyncio engine requires aiohttp (and aiohttp_socks for the proxy)')
+        if proxy and ProxyConnector is None:
+            raise ImportError('the asyncio engine requires aiohttp_socks to use the proxies')
+        self.proxy = proxy
+        self.concurrency = concurrency
+        self.n_jobs = n_jobs
+        self.no_requests = 0
+        self.deferred = []
+
+    def _create_session(self, proxy_url=None):
+        if proxy_url is not None:
+            connector = ProxyConnector.from_url(proxy_url, limit=self.concurrency)
+        else:
+            connector = aiohttp.TCPConnector(limit=self.concurrency)
+        headers = {
+            'user-agent': random.choice(jcfg.UA_LIST),
+            'Accept-Language': 'en-GB,en;q=0.9,en-US;q=0.8,zh-CN;q=0.7,zh;q=0.6,zh-TW;q=0.5',
+            'Cache-Control': 'no-cache',
+            # aiohttp decodes brotli with the same packages urllib3 looks for, but not zstd
+            'Accept-Encoding': ', '.join(e for e in ACCEPT_ENCODING.split(',') if e != 'zstd'),
+            'origin': 'https://google.com'
+        }
+        timeout = aiohttp.ClientTimeout(sock_connect=jcfg.HTTP_CONNECT_TIMEOUT, sock_read=jcfg.HTTP_READ_TIMEOUT)
+        return aiohttp.ClientSession(connector=connector, headers=headers, timeout=timeout)
+
+    async def _run_each(self, element, url, function, sessions, proxy_pool, semaphore, pool, progress):
+        loop = asyncio.get_running_loop()
+        async with semaphore:
+            apiparse = AsyncYahooAPIParser(url=url, sessions=sessions, proxy_pool=proxy_pool)
+            try:
+                js = await apiparse.parse()
+            except CircuitOpenError as e:
+                self.deferred.append(element)
+                if progress is not None:
+                    progress.update(1)
+                return e
+            except WebParseError:
+                js = None
+            finally:
+                self.no_requests += apiparse.no_requests
+        try:
+            return await loop.run_in_executor(pool, function, element, js)
+        except Exception as e:
+            return e
+        finally:
+            if progress is not None:
+                progress.update(1)
+
+    async def _run(self, array, url_builder, function, use_tqdm):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        progress = tqdm(total=len(array), unit='it', unit_scale=True, leave=True, ncols=80) if use_tqdm else None
+        proxy_pool = get_proxy_pool() if self.proxy else None
+        proxy_urls = [proxy.url for proxy in proxy_pool.proxies] if proxy_pool is not None else [None]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.n_jobs) as pool:
+            sessions = {proxy_url: self._create_session(proxy_url) for proxy_url in proxy_urls}
+            try:
+                out = await asyncio.gather(*[self._run_each(a, url_builder(a), function, sessions, proxy_pool,
+                                                            semaphore, pool, progress)
+                                             for a in array])
+            finally:
+                for session in sessions.values():
+                    await session.close()
+        if progress is not None:
+            progress.close()
+        return out
+
+    def run(self, array, url_builder, function, use_tqdm=True):
+        """
+            Returns:
+                [function(array[0], js), function(array[1], js), ...] with exceptions in place of failed calls
+        """
+        return asyncio.run(self._run(array, url_builder, function, use_tqdm))
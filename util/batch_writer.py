@@ -0,0 +1,242 @@
+import atexit
+import concurrent.futures
+import threading
+import time
+import pandas as pd
+from configs import job_configs as jcfg
+from util.helper_functions import create_log
+from util.bulk_load import bulk_load
+from util.insert_modes import insert_method
+
+
+class BatchWriterError(Exception):
+    pass
+
+
+class _TableBuffer:
+    def __init__(self):
+        self.frames = []
+        self.futures = []
+        self.rows = 0
+        self.since = 0.0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.seconds = 0.0
+
+
+class BatchWriter:
+    """
+        Collects the rows the extractors insert ticker by ticker into one buffer per table, and writes each buffer in
+        a background thread once it holds `rows` rows or its oldest rows waited `interval` seconds, as executemany
+        statements of `chunk_size` rows. put() blocks while `max_rows` rows are buffered, so a slow database holds
+        the producers back instead of the buffers growing without bound.
+
+        A buffer that fails as a whole (eg. one ticker brought a column the table does not have) is written again
+        frame by frame, so only the rows at fault are lost; they are logged and counted as failed.
+
+        put() returns a Future of each frame, resolved with its number of rows once they are committed or with the
+        exception that made them fail; PendingWrites collects them per ticker.
+
+        Rows put with a `mode` other than append are inserted as in util.insert_modes. Rows put with bulk=True are
+        written with LOAD DATA LOCAL INFILE (util.bulk_load) instead of INSERT statements, and frame by frame with
+        INSERT statements when the load fails (eg. local_infile is off on the server).
+    """
+
+    def __init__(self, con, rows=jcfg.BATCH_WRITER_ROWS, interval=jcfg.BATCH_WRITER_INTERVAL,
+                 chunk_size=jcfg.BATCH_WRITER_CHUNK_SIZE, max_rows=jcfg.BATCH_WRITER_MAX_ROWS, loggerFileName=None):
+        self.con = con
+        self.rows = rows
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.max_rows = max_rows
+        self.logger = create_log(loggerName='BatchWriter', loggerFileName=loggerFileName)
+        self._cond = threading.Condition()
+        self._buffers = {}
+        # rows handed over and not written yet, including the buffers being written
+        self._buffered = 0
+        self._writing = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='batch-writer', daemon=True)
+        self._thread.start()
+
+    def put(self, table, df, index=False, bulk=False, mode='append') -> concurrent.futures.Future:
+        """
+            Hands df over to be appended to table (with its index if `index`); df must not be changed afterwards.
+        """
+        future = concurrent.futures.Future()
+        rows = len(df)
+        if rows == 0:
+            future.set_result(0)
+            return future
+        with self._cond:
+            # a frame larger than max_rows still goes through once the buffers are empty
+            self._cond.wait_for(lambda: self._closed or self._buffered == 0 or self._buffered + rows <= self.max_rows)
+            if self._closed:
+                raise BatchWriterError(f'the writer is closed, rows for {table} cannot be buffered')
+            buffer = self._buffers.setdefault((table, index, bulk, mode), _TableBuffer())
+            if not buffer.frames:
+                buffer.since = time.monotonic()
+            buffer.frames.append(df)
+            buffer.futures.append(future)
+            buffer.rows += rows
+            self._buffered += rows
+            if buffer.rows >= self.rows:
+                self._cond.notify_all()
+        return future
+
+    def _take(self, force=False):
+        # the buffers due to be written, emptied; called with the lock held
+        now = time.monotonic()
+        taken = []
+        for key, buffer in self._buffers.items():
+            if buffer.frames and (force or buffer.rows >= self.rows or now - buffer.since >= self.interval):
+                taken.append((key, buffer.frames, buffer.futures, buffer.rows))
+                buffer.frames, buffer.futures, buffer.rows = [], [], 0
+        self._writing += len(taken)
+        return taken
+
+    def _to_sql(self, frames, table, index, bulk, mode):
+        if bulk:
+            bulk_load(frames, table, self.con, index, mode=mode)
+        else:
+            df = pd.concat(frames) if len(frames) > 1 else frames[0]
+            df.to_sql(name=table, con=self.con, if_exists='append', index=index, chunksize=self.chunk_size,
+                      method=insert_method(table, mode))
+
+    def _write(self, key, frames, futures, rows):
+        table, index, bulk, mode = key
+        start = time.perf_counter()
+        try:
+            self._to_sql(frames, table, index, bulk, mode)
+            written, failed = rows, 0
+            for df, future in zip(frames, futures):
+                future.set_result(len(df))
+        except Exception as e:
+            self.logger.debug(f'{table}: batch of {rows} rows failed as {e}, writing it frame by frame')
+            written = failed = 0
+            for df, future in zip(frames, futures):
+                try:
+                    self._to_sql([df], table, index, False, mode)
+                    written += len(df)
+                    future.set_result(len(df))
+                except Exception as e:
+                    failed += len(df)
+                    self.logger.error(f'{table}: {len(df)} rows failed to be inserted as {e}')
+                    future.set_exception(BatchWriterError(f'{len(df)} rows failed to be inserted to {table} as {e}'))
+        seconds = time.perf_counter() - start
+        with self._cond:
+            buffer = self._buffers[key]
+            buffer.written += written
+            buffer.failed += failed
+            buffer.batches += 1
+            buffer.seconds += seconds
+            self._buffered -= rows
+            self._writing -= 1
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                taken = self._take()
+                while not taken and not self._closed:
+                    self._cond.wait(timeout=min(1.0, self.interval))
+                    taken = self._take()
+                if not taken:
+                    return
+            for batch in taken:
+                self._write(*batch)
+
+    def flush(self):
+        """
+            Writes everything buffered so far and returns once it is in the database.
+        """
+        with self._cond:
+            taken = self._take(force=True)
+        for batch in taken:
+            self._write(*batch)
+        with self._cond:
+            self._cond.wait_for(lambda: self._writing == 0)
+
+    def close(self):
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def stats(self) -> dict:
+        tables = {}
+        with self._cond:
+            for (table, *_), buffer in self._buffers.items():
+                entry = tables.setdefault(table, {'rows': 0, 'failed': 0, 'batches': 0, 'seconds': 0.0,
+                                                  'buffered': 0})
+                entry['rows'] += buffer.written
+                entry['failed'] += buffer.failed
+                entry['batches'] += buffer.batches
+                entry['seconds'] += buffer.seconds
+                entry['buffered'] += buffer.rows
+        for entry in tables.values():
+            entry['rows_per_sec'] = entry['rows'] / entry['seconds'] if entry['seconds'] else 0.0
+        return tables
+
+    def report(self) -> list:
+        return [f"{table}: {s['rows']} rows in {s['batches']} batches, {s['rows_per_sec']:.0f} rows/s, "
+                f"{s['failed']} rows failed" for table, s in self.stats().items()]
+
+
+class PendingWrites:
+    """
+        The futures put() returned for the rows of a job, by ticker (or page), so that once the writer is flushed the
+        job can retry the tickers whose rows failed and count the rows actually written.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._futures = []
+
+    def add(self, key, future) -> None:
+        with self._lock:
+            self._futures.append((key, future))
+
+    def collect(self) -> list:
+        """
+            (key, rows written, exception or None) of each write added since the last call, once they completed;
+            call it after flush_batch_writer().
+        """
+        with self._lock:
+            futures, self._futures = self._futures, []
+        results = []
+        for key, future in futures:
+            error = future.exception()
+            results.append((key, 0 if error is not None else future.result(), error))
+        return results
+
+
+_batch_writer = None
+_batch_writer_lock = threading.Lock()
+
+
+def get_batch_writer(con) -> BatchWriter:
+    """
+        The writer shared by every extractor of the process, created on the first call with the engine `con`. What
+        it still buffers is written when the interpreter exits.
+    """
+    global _batch_writer
+    with _batch_writer_lock:
+        if _batch_writer is None:
+            _batch_writer = BatchWriter(con)
+            atexit.register(_batch_writer.close)
+        return _batch_writer
+
+
+def flush_batch_writer() -> list:
+    """
+        Writes what the shared writer buffers, eg. before a job reads its own rows back, and returns its report.
+    """
+    with _batch_writer_lock:
+        writer = _batch_writer
+    if writer is None:
+        return []
+    writer.flush()
+    return writer.report()
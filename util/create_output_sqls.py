@@ -1,21 +1,12 @@
 import os
-from sqlalchemy import create_engine
-from configs import database_configs_nas as dbcfg
+from util.db_engine import Engine
 from configs import job_configs as jcfg
 import pandas as pd
 import datetime
 
 
 class write_insert_db:
-    database_ip = dbcfg.MYSQL_HOST
-    database_user = dbcfg.MYSQL_USER
-    database_pw = dbcfg.MYSQL_PASSWORD
-    database_port = dbcfg.MYSQL_PORT
-    database_nm = dbcfg.MYSQL_DATABASE
-
-    cnn = create_engine(f'mysql+mysqlconnector://{database_user}:{database_pw}@{database_ip}:{database_port}/{database_nm}',
-                        pool_size=20,
-                        max_overflow=0)
+    cnn = Engine('nas')
 
     def __init__(self, table, updated_dt):
         self.updated_dt = updated_dt
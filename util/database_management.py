@@ -1,5 +1,7 @@
-from configs import database_configs_nas as dbcfg
-from sqlalchemy import create_engine
+from util.db_engine import Engine
+from util.batch_writer import get_batch_writer
+from util.bulk_load import bulk_load
+from util.insert_modes import resolve_mode, insert_method
 import pandas as pd
 
 
@@ -8,20 +10,10 @@ class DatabaseManagementError(Exception):
 
 
 class DatabaseManagement:
-    database_ip = dbcfg.MYSQL_HOST
-    database_user = dbcfg.MYSQL_USER
-    database_pw = dbcfg.MYSQL_PASSWORD
-    database_port = dbcfg.MYSQL_PORT
-    database_nm = dbcfg.MYSQL_DATABASE
-    try:
-        cnn = create_engine(
-            f'mysql+mysqlconnector://{database_user}:{database_pw}@{database_ip}:{database_port}/{database_nm}',
-            pool_size=20,
-            max_overflow=0)
-    except Exception as e:
-        raise DatabaseManagementError(f'database cannot be created, {e}')
+    cnn = Engine('nas')
 
-    def __init__(self, data_df=None, table=None, key=None, where=None, date=None, sql=None, insert_index=False):
+    def __init__(self, data_df=None, table=None, key=None, where=None, date=None, sql=None, insert_index=False,
+                 buffered=False, bulk_load=False, mode='append'):
         self.data_df = data_df
         self.table = table
         self.key = key
@@ -29,6 +21,12 @@ class DatabaseManagement:
         self.date = date
         self.sql = sql
         self.insert_index = insert_index
+        # insert_db hands the rows over to the shared BatchWriter instead of writing them in a transaction of their own
+        self.buffered = buffered
+        # insert_db loads the rows with LOAD DATA LOCAL INFILE through a staging table, for the large tables
+        self.bulk_load = bulk_load
+        # 'ignore' or 'upsert' leave the duplicate check to the unique key of the table (jcfg.TABLE_UNIQUE_KEYS)
+        self.mode = mode
 
     def insert_db(self):
         try:
@@ -36,12 +34,20 @@ class DatabaseManagement:
                 raise DatabaseManagementError(f"dataframe is empty, therefore cannot be inserted")
             elif self.table is None:
                 DatabaseManagementError(f"table to be inserted is empty, therefore cannot be inserted")
+            # a bad mode fails here rather than in the writer thread
+            mode = resolve_mode(self.cnn, self.table, self.mode)
+            if self.buffered:
+                # the Future of the rows, which fail (if they do) once the writer gets to them
+                return get_batch_writer(self.cnn).put(self.table, self.data_df, self.insert_index, self.bulk_load,
+                                                      mode)
+            elif self.bulk_load:
+                bulk_load([self.data_df], self.table, self.cnn, self.insert_index, mode=mode)
             else:
                 self.data_df.to_sql(name=self.table,
                                     con=self.cnn,
                                     if_exists='append',
                                     index=self.insert_index,
-                                    method='multi',
+                                    method=insert_method(self.table, mode) or 'multi',
                                     chunksize=200)
         except Exception as e:
             raise DatabaseManagementError(f"data insert to {self.table} failed as {e}")
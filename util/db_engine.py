@@ -0,0 +1,120 @@
+import importlib
+import threading
+import time
+from sqlalchemy import create_engine, exc
+from sqlalchemy.pool import QueuePool
+from configs import job_configs as jcfg
+
+
+class DatabaseEngineError(Exception):
+    pass
+
+
+class CheckoutMetrics:
+    """
+        Connection checkouts of a pool and how long they waited for a free connection: waits show the workers
+        outnumber the connections, timeouts that they starved.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.waited = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+
+    def record(self, seconds, timed_out=False):
+        with self._lock:
+            self.checkouts += 1
+            self.waited += int(seconds >= jcfg.DB_POOL_SLOW_CHECKOUT)
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self.timeouts += int(timed_out)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'checkouts': self.checkouts,
+                    'waited': self.waited,
+                    'wait_avg': self.wait_total / self.checkouts if self.checkouts else 0.0,
+                    'wait_max': self.wait_max,
+                    'timeouts': self.timeouts}
+
+
+class TimedQueuePool(QueuePool):
+    """
+        QueuePool timing every checkout into `metrics`, which is kept when the pool is recreated on dispose().
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = CheckoutMetrics()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            self.metrics.record(time.perf_counter() - start, timed_out)
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(name='nas'):
+    """
+        The engine of the database configured in configs.database_configs_<name> (nas or prod), shared by the whole
+        process and created on first use, with a pool of DB_POOL_SIZE connections (sized in configs.job_configs from
+        the worker, pipeline write and batch writer counts, so a full run never waits on a connection).
+    """
+    with _engines_lock:
+        if name not in _engines:
+            try:
+                cfg = importlib.import_module(f'configs.database_configs_{name}')
+                _engines[name] = create_engine(
+                    f'mysql+mysqlconnector://{cfg.MYSQL_USER}:{cfg.MYSQL_PASSWORD}@{cfg.MYSQL_HOST}:{cfg.MYSQL_PORT}/'
+                    f'{cfg.MYSQL_DATABASE}',
+                    poolclass=TimedQueuePool,
+                    pool_size=jcfg.DB_POOL_SIZE,
+                    max_overflow=jcfg.DB_POOL_MAX_OVERFLOW,
+                    pool_timeout=jcfg.DB_POOL_TIMEOUT,
+                    connect_args={'allow_local_infile': True})
+            except Exception as e:
+                raise DatabaseEngineError(f'database engine {name} cannot be created, {e}')
+        return _engines[name]
+
+
+def pool_stats() -> dict:
+    with _engines_lock:
+        engines = dict(_engines)
+    return {name: dict(engine.pool.metrics.stats(), size=engine.pool.size(), checked_out=engine.pool.checkedout())
+            for name, engine in engines.items()}
+
+
+def pool_report() -> list:
+    return [f"{name}: {s['checkouts']} checkouts, {s['waited']} waited, avg wait {s['wait_avg'] * 1000:.1f}ms, "
+            f"max wait {s['wait_max']:.2f}s, {s['timeouts']} timeouts, {s['checked_out']}/{s['size']} in use"
+            for name, s in pool_stats().items()]
+
+
+class Engine:
+    """
+        Class attribute resolving to get_engine(name) when read, so that importing a module opens no pool:
+        `cnn = Engine('nas')`.
+    """
+
+    def __init__(self, name='nas'):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        return get_engine(self.name)
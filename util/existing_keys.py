@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+
+def to_days(dates) -> np.ndarray:
+    # days since 1970-01-01, NaT as -1 (no stored date is that old)
+    dates = pd.to_datetime(pd.Index(dates))
+    days = dates.to_numpy('datetime64[D]').astype(np.int64)
+    days[dates.isna()] = -1
+    return days.astype(np.int32)
+
+
+class ExistingKeys:
+    """
+        The dates already stored per (type, ticker), eg. the asOfDate of every row of the annual, quarterly and
+        trailing fundamentals tables, held as one sorted int32 array of day numbers per key. Checking the rows of a
+        stock is then a dict lookup and a binary search instead of a scan of the whole history.
+    """
+
+    def __init__(self):
+        self._days = {}
+
+    def add(self, key_type, tickers, dates) -> None:
+        tickers = pd.Categorical(tickers)
+        days = to_days(dates)
+        keep = (tickers.codes >= 0) & (days >= 0)
+        codes, days = tickers.codes[keep], days[keep]
+        order = np.lexsort((days, codes))
+        codes, days = codes[order], days[order]
+        bounds = np.flatnonzero(np.diff(codes)) + 1
+        starts = np.r_[0, bounds] if len(codes) else []
+        for code, chunk in zip(codes[starts], np.split(days, bounds)):
+            self._days[(key_type, tickers.categories[code])] = np.unique(chunk)
+
+    def isin(self, key_type, ticker, dates) -> np.ndarray:
+        days = to_days(dates)
+        existing = self._days.get((key_type, ticker))
+        if existing is None:
+            return np.zeros(len(days), dtype=bool)
+        found = np.minimum(np.searchsorted(existing, days), len(existing) - 1)
+        return existing[found] == days
+
+    def latest_by_ticker(self) -> dict:
+        # the latest date of each ticker in the type it is least up to date in
+        latest = {}
+        for (_, ticker), days in self._days.items():
+            latest[ticker] = min(latest.get(ticker, days[-1]), days[-1])
+        return {ticker: pd.Timestamp(int(day), unit='D') for ticker, day in latest.items()}
+
+    def __len__(self):
+        return len(self._days)
+
+    @property
+    def rows(self) -> int:
+        return sum(len(days) for days in self._days.values())
+
+    @property
+    def nbytes(self) -> int:
+        return sum(days.nbytes for days in self._days.values())
@@ -1,3 +1,15 @@
+import csv
+import io
+import numpy as np
+import pandas as pd
+from configs import finviz_configs as fcfg
+
+SUFFIX_MULTIPLIERS = {'K': 1e3, 'M': 1e6, 'B': 1e9, 'T': 1e12}
+NUMERIC_TYPES = ('number', 'percent', 'integer', 'suffix')
+DATE_FORMAT = '%m/%d/%Y'
+CELL_SEP = '\x1f'
+
+
 def convert_str_to_num(str_v: str):
     if not (isinstance(str_v, str)):
         data = str_v
@@ -18,7 +30,7 @@ def convert_str_to_num(str_v: str):
             data = str_v
     elif 'T' in str_v:
         try:
-            data = int(float(str_v.split('B')[0]) * 1000000000000)
+            data = int(float(str_v.split('T')[0]) * 1000000000000)
         except:
             data = str_v
     elif '%' in str_v:
@@ -37,3 +49,68 @@ def convert_str_to_num(str_v: str):
         data = str_v
 
     return data
+
+
+def _as_text(values: pd.Series):
+    values = values.astype(object)
+    text = values.where(values.isna(), values.astype(str)).str.strip()
+    return text.where(text != '-')
+
+
+def _join_cells(row: list):
+    try:
+        return CELL_SEP.join(row)
+    except TypeError:
+        return CELL_SEP.join(v if isinstance(v, str) else '-' if pd.isna(v) else str(v) for v in row)
+
+
+def _parse_numbers(block: pd.DataFrame):
+    """
+        Parse every cell of `block` as a float in one pass of the C csv tokenizer: the cells are joined into a single
+        text, '%' and the K/M/B/T suffixes are dropped, ',' is read as the thousands separator and '-' as NaN.
+        A column holding anything else falls back to pd.to_numeric, which turns those cells into NaN.
+    """
+    text = '\n'.join(_join_cells(row) for row in block.to_numpy(dtype=object).tolist())
+    for char in '%' + ''.join(SUFFIX_MULTIPLIERS):
+        text = text.replace(char, '')
+    parsed = pd.read_csv(io.StringIO(text), sep=CELL_SEP, header=None, names=list(range(block.shape[1])),
+                         na_values=['-'], keep_default_na=False, thousands=',', quoting=csv.QUOTE_NONE,
+                         skipinitialspace=True, skip_blank_lines=False)
+    parsed.columns = block.columns
+    parsed.index = block.index
+    for column in parsed.columns[parsed.dtypes == object]:
+        parsed[column] = pd.to_numeric(parsed[column].str.strip(), errors='coerce')
+    return parsed.astype('float64')
+
+
+def convert_columns(df: pd.DataFrame, schema: dict = None):
+    """
+        Convert the renamed screener columns to their types in `schema` (fcfg.FINVIZ_COLUMN_TYPES by default):
+        text stays str, number/percent come back as float64, integer/suffix as Int64 and date as datetime64, with
+        '-' and cells that do not fit the type as missing. Columns without a type are left untouched.
+
+        All the numeric columns are parsed together in a single pass rather than cell by cell.
+    """
+    schema = fcfg.FINVIZ_COLUMN_TYPES if schema is None else schema
+    kinds = {column: schema[column] for column in df.columns if column in schema}
+    numeric = [column for column, kind in kinds.items() if kind in NUMERIC_TYPES]
+    numbers = _parse_numbers(df[numeric]) if numeric and len(df) else df[numeric].astype('float64')
+
+    out = {}
+    for column, kind in kinds.items():
+        if kind == 'text':
+            out[column] = _as_text(df[column])
+        elif kind == 'date':
+            out[column] = pd.to_datetime(_as_text(df[column]), format=DATE_FORMAT, errors='coerce')
+        elif kind == 'number':
+            out[column] = numbers[column]
+        elif kind == 'percent':
+            out[column] = numbers[column] / 100
+        elif kind == 'integer':
+            out[column] = numbers[column].round().astype('Int64')
+        elif kind == 'suffix':
+            multiplier = _as_text(df[column]).str[-1].map(SUFFIX_MULTIPLIERS).fillna(1)
+            out[column] = (numbers[column] * multiplier).round().astype('Int64')
+        else:
+            raise ValueError(f'unknown Finviz column type {kind} for {column}')
+    return pd.DataFrame({column: out.get(column, df[column]) for column in df.columns}, index=df.index)
@@ -1,18 +1,9 @@
-from configs import database_configs_nas as dbcfg
-from sqlalchemy import create_engine
+from util.db_engine import Engine
 import pandas as pd
 
 class StockPopulation:
 
-    database_ip = dbcfg.MYSQL_HOST
-    database_user = dbcfg.MYSQL_USER
-    database_pw = dbcfg.MYSQL_PASSWORD
-    database_port = dbcfg.MYSQL_PORT
-    database_nm = dbcfg.MYSQL_DATABASE
-
-    cnn = create_engine(f'mysql+mysqlconnector://{database_user}:{database_pw}@{database_ip}:{database_port}/{database_nm}',
-                        pool_size=20,
-                        max_overflow=0)
+    cnn = Engine('nas')
 
     def get_stock_list(self):
         sql = """SELECT DISTINCT ticker 
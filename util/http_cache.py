@@ -0,0 +1,143 @@
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from configs import job_configs as jcfg
+
+
+class ResponseCache:
+    """
+        On-disk cache of successful response bodies, keyed on the normalized url.
+
+        Bodies are zlib-compressed into a SQLite file. The TTL is looked up per endpoint from jcfg.HTTP_CACHE_TTL
+        when an entry is read, and the least recently used entries are evicted once the file holds more than
+        `max_bytes` of compressed bodies.
+    """
+
+    def __init__(self, path=jcfg.HTTP_CACHE_PATH, max_bytes=jcfg.HTTP_CACHE_MAX_BYTES, ttl=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = jcfg.HTTP_CACHE_TTL if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                url TEXT PRIMARY KEY,
+                                body BLOB,
+                                size INTEGER,
+                                stored_at REAL,
+                                accessed_at REAL)""")
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+        self._size = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(url):
+        # lower-case the host, sort the query and drop parameters that change on every call (eg. period2=now)
+        parts = urlsplit(url)
+        query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                       if k not in jcfg.HTTP_CACHE_IGNORED_PARAMS)
+        return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, urlencode(query), ''))
+
+    def ttl_for(self, url):
+        for endpoint, ttl in self.ttl.items():
+            if endpoint in url:
+                return ttl
+        return self.ttl.get('default', 0)
+
+    def get(self, url):
+        key = self.normalize(url)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT body, stored_at FROM responses WHERE url = ?', (key,)).fetchone()
+            if row is None or row[1] + self.ttl_for(key) < now:
+                self.misses += 1
+                return None
+            self._conn.execute('UPDATE responses SET accessed_at = ? WHERE url = ?', (now, key))
+            self.hits += 1
+        return zlib.decompress(row[0])
+
+    def put(self, url, body: bytes):
+        key = self.normalize(url)
+        if self.ttl_for(key) <= 0:
+            return None
+        compressed = zlib.compress(body)
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute('SELECT size FROM responses WHERE url = ?', (key,)).fetchone()
+            self._conn.execute('INSERT OR REPLACE INTO responses (url, body, size, stored_at, accessed_at) '
+                               'VALUES (?, ?, ?, ?, ?)', (key, compressed, len(compressed), now, now))
+            self._size += len(compressed) - (old[0] if old else 0)
+            self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes:
+            rows = self._conn.execute('SELECT url, size FROM responses ORDER BY accessed_at LIMIT 100').fetchall()
+            if not rows:
+                self._size = 0
+                break
+            self._conn.executemany('DELETE FROM responses WHERE url = ?', [(url,) for url, _ in rows])
+            self._size -= sum(size for _, size in rows)
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
+
+
+class ValidatorStore:
+    """
+        ETag / Last-Modified of the pages fetched with conditional requests, keyed on the normalized url.
+
+        `payload` optionally keeps what the caller extracted from the page, for callers that still need the data
+        when the server answers 304 Not Modified.
+    """
+
+    def __init__(self, path=jcfg.VALIDATOR_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS validators (
+                                url TEXT PRIMARY KEY,
+                                etag TEXT,
+                                last_modified TEXT,
+                                payload BLOB,
+                                stored_at REAL)""")
+
+    def get(self, url):
+        key = ResponseCache.normalize(url)
+        with self._lock:
+            row = self._conn.execute('SELECT etag, last_modified, payload FROM validators WHERE url = ?',
+                                     (key,)).fetchone()
+        if row is None:
+            return None
+        return {'etag': row[0], 'last_modified': row[1], 'payload': zlib.decompress(row[2]) if row[2] else None}
+
+    def put(self, url, etag, last_modified, payload: bytes = None):
+        key = ResponseCache.normalize(url)
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO validators (url, etag, last_modified, payload, stored_at) '
+                               'VALUES (?, ?, ?, ?, ?)',
+                               (key, etag, last_modified, zlib.compress(payload) if payload else None, time.time()))
+
+
+_validator_store = None
+_validator_store_lock = threading.Lock()
+
+
+def get_validator_store() -> ValidatorStore:
+    global _validator_store
+    with _validator_store_lock:
+        if _validator_store is None:
+            _validator_store = ValidatorStore()
+        return _validator_store
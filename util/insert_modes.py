@@ -0,0 +1,114 @@
+import threading
+from sqlalchemy.dialects.mysql import insert
+from configs import job_configs as jcfg
+from util.helper_functions import create_log
+
+# append: plain INSERT, ignore: rows whose unique key is stored already are skipped, upsert: they are overwritten; both
+# are INSERT ... ON DUPLICATE KEY UPDATE, ignore with a no-op update of the key (INSERT IGNORE would also turn
+# truncations, NULLs in NOT NULL columns and invalid values into warnings)
+INSERT_MODES = ['append', 'ignore', 'upsert']
+
+
+class InsertModeError(Exception):
+    pass
+
+
+def check_mode(table, mode) -> None:
+    if mode not in INSERT_MODES:
+        raise InsertModeError(f'unknown insert mode {mode}, expected one of {INSERT_MODES}')
+    if mode != 'append' and table not in jcfg.TABLE_UNIQUE_KEYS:
+        raise InsertModeError(f'{table} has no unique key in TABLE_UNIQUE_KEYS, it cannot be written with mode={mode}')
+
+
+_unique_keys = {}
+_unique_keys_lock = threading.Lock()
+logger = create_log(loggerName='InsertModes')
+
+
+def unique_key_ddl(table, target=None) -> str:
+    # the statement adding the unique key TABLE_UNIQUE_KEYS declares for table (to target, eg. a copy of it)
+    names = ', '.join(f'`{column}`' for column in jcfg.TABLE_UNIQUE_KEYS[table])
+    return f'ALTER TABLE `{target or table}` ADD UNIQUE KEY `uk_{table}` ({names})'
+
+
+def has_unique_key(con, table) -> bool:
+    """
+        Whether table has a UNIQUE index on exactly the columns TABLE_UNIQUE_KEYS declares, read with SHOW INDEX.
+    """
+    try:
+        with con.connect() as conn:
+            indexes = conn.exec_driver_sql(f'SHOW INDEX FROM `{table}`').mappings().all()
+    except Exception as e:
+        raise InsertModeError(f'indexes of {table} cannot be read, {e}')
+    unique = {}
+    for index in indexes:
+        if int(index['Non_unique']) == 0:
+            unique.setdefault(index['Key_name'], set()).add(index['Column_name'])
+    return set(jcfg.TABLE_UNIQUE_KEYS[table]) in unique.values()
+
+
+def resolve_mode(con, table, mode) -> str:
+    """
+        check_mode, then the mode table can be written with: ignore / upsert need the unique key on the server
+        (checked once per database and table), without it the server would let every duplicate through, so until
+        migrate_unique_keys.py has added it the rows are appended, with one warning per table.
+    """
+    check_mode(table, mode)
+    if mode == 'append':
+        return mode
+    key = (str(con.url), table)
+    with _unique_keys_lock:
+        found = _unique_keys.get(key)
+    if found is None:
+        found = has_unique_key(con, table)
+        with _unique_keys_lock:
+            if key not in _unique_keys and not found:
+                logger.warning(f'{table} has no unique index on {jcfg.TABLE_UNIQUE_KEYS[table]}, rows are appended '
+                               f'instead of mode={mode} until migrate_unique_keys.py adds it')
+            _unique_keys[key] = found
+    return mode if found else 'append'
+
+
+def _updated_columns(table, columns) -> list:
+    unique = jcfg.TABLE_UNIQUE_KEYS[table]
+    return [column for column in columns if column not in unique]
+
+
+def insert_method(table, mode):
+    """
+        The to_sql `method` writing table with `mode`: None (pandas default) for append, otherwise a multi-row
+        MySQL INSERT ... ON DUPLICATE KEY UPDATE per chunk.
+    """
+    check_mode(table, mode)
+    if mode == 'append':
+        return None
+
+    def method(pd_table, conn, keys, data_iter):
+        statement = insert(pd_table.table).values([dict(zip(keys, row)) for row in data_iter])
+        updated = _updated_columns(table, keys) if mode == 'upsert' else []
+        if updated:
+            statement = statement.on_duplicate_key_update({column: statement.inserted[column] for column in updated})
+        else:
+            key = jcfg.TABLE_UNIQUE_KEYS[table][0]
+            statement = statement.on_duplicate_key_update({key: pd_table.table.c[key]})
+        return conn.execute(statement).rowcount
+
+    return method
+
+
+def merge_statement(table, mode, source, columns) -> str:
+    """
+        INSERT ... SELECT copying `columns` of the table `source` (eg. a staging table) into table with `mode`.
+    """
+    check_mode(table, mode)
+    names = ', '.join(f'`{column}`' for column in columns)
+    statement = f'INSERT INTO `{table}` ({names}) SELECT {names} FROM {source}'
+    if mode == 'append':
+        return statement
+    updated = _updated_columns(table, columns) if mode == 'upsert' else []
+    if updated:
+        assignments = ', '.join(f'`{column}` = VALUES(`{column}`)' for column in updated)
+    else:
+        key = jcfg.TABLE_UNIQUE_KEYS[table][0]
+        assignments = f'`{key}` = `{table}`.`{key}`'
+    return f'{statement} ON DUPLICATE KEY UPDATE {assignments}'
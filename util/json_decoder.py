@@ -0,0 +1,59 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+class JSONDecodeError(ValueError):
+    pass
+
+
+def loads(data):
+    """
+        Decode a JSON document straight from the response bytes (str is accepted too).
+
+        orjson is used when it is installed, otherwise the stdlib decoder, which also reads bytes without a separate
+        str copy of the body.
+    """
+    try:
+        if orjson is not None:
+            return orjson.loads(data)
+        return json.loads(data)
+    except ValueError as e:
+        raise JSONDecodeError(e)
+
+
+def can_stream():
+    return ijson is not None
+
+
+def load_items(stream, path: str):
+    """
+        Incrementally decode the array at `path` (eg. 'timeseries.result') from a file-like object.
+
+        Only the items of the array are kept, so the peak memory is the decoded items rather than the raw body plus
+        the decoded document. Returns the document with just that array, eg. {'timeseries': {'result': [...]}}.
+        Falls back to decoding the whole body when ijson is not installed.
+    """
+    if ijson is None:
+        js = loads(stream.read())
+        for key in path.split('.'):
+            js = js.get(key) if isinstance(js, dict) else None
+        items = js or []
+    else:
+        try:
+            items = list(ijson.items(stream, f'{path}.item', use_float=True))
+        except ijson.JSONError as e:
+            raise JSONDecodeError(e)
+
+    out = items
+    for key in reversed(path.split('.')):
+        out = {key: out}
+    return out
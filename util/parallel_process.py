@@ -1,9 +1,126 @@
 from configs import job_configs as jcfg
 from tqdm import tqdm
 import concurrent.futures
+import itertools
+import multiprocessing
+import time
 
 
-def parallel_process(array, function, n_jobs=jcfg.WORKER, use_kwargs=False, front_num=3, use_tqdm=True):
+class TaskTimings:
+    """
+        Seconds each task took in one run of parallel_process / parallel_iter, and the wall time of the run.
+
+        utilization is the task time over the worker time (wall time x workers): well below 1 means workers sat
+        idle, eg. waiting on a long task at the end.
+    """
+
+    def __init__(self):
+        self.durations = {}
+        self.wall = 0.0
+        self.n_jobs = 1
+
+    def record(self, key, seconds):
+        self.durations[key] = seconds
+
+    @property
+    def busy(self):
+        return sum(self.durations.values())
+
+    @property
+    def utilization(self):
+        return self.busy / (self.wall * self.n_jobs) if self.wall else 0.0
+
+    def report(self):
+        longest = max(self.durations.values(), default=0.0)
+        return (f"{len(self.durations)} tasks on {self.n_jobs} workers: {self.wall:.1f}s wall, "
+                f"{self.busy:.1f}s task time, {self.utilization:.0%} utilization, longest task {longest:.1f}s")
+
+
+class _Timed:
+    # module level so that it pickles for the process backend
+    def __init__(self, function):
+        self.function = function
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = self.function(*args, **kwargs)
+        except Exception as e:
+            result = e
+        return time.perf_counter() - start, result
+
+
+class TaskDeadlineExceeded(TimeoutError):
+    pass
+
+
+class _Deadlines:
+    """
+        Per-task wall-clock deadline: a task running for longer than `deadline` seconds is given up on and its
+        result is a TaskDeadlineExceeded. A thread cannot be stopped, so its worker stays busy until the task
+        returns (a hung request does once its read timeout expires), but the job does not wait for it.
+    """
+
+    def __init__(self, deadline=None):
+        self.deadline = deadline
+        self._started = {}
+        self.expired = 0
+
+    def wait(self, pending):
+        # the futures of pending that completed or ran out of time
+        if self.deadline is None:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            return done
+        done, _ = concurrent.futures.wait(pending, timeout=min(1.0, self.deadline / 10),
+                                          return_when=concurrent.futures.FIRST_COMPLETED)
+        now = time.monotonic()
+        expired = {future for future in pending if future not in done and future.running() and
+                   now - self._started.setdefault(future, now) > self.deadline}
+        self.expired += len(expired)
+        return done | expired
+
+    def result(self, future):
+        if not future.done():
+            raise TaskDeadlineExceeded(f'task still running after {self.deadline}s')
+        return future.result()
+
+    def shutdown(self, pool):
+        # do not block on the tasks that ran past their deadline
+        pool.shutdown(wait=not self.expired, cancel_futures=True)
+
+
+def _identity(a):
+    return a
+
+
+def longest_first(array, cost, key=_identity):
+    """
+        Positions of `array` ordered by the estimated seconds in `cost` (keyed on key(element)), longest first.
+        Elements without an estimate (eg. new tickers) are given the median one.
+    """
+    estimates = [cost.get(key(a)) for a in array]
+    known = sorted(c for c in estimates if c is not None)
+    default = known[len(known) // 2] if known else 0.0
+    return sorted(range(len(array)), key=lambda i: default if estimates[i] is None else estimates[i], reverse=True)
+
+
+def create_pool(n_jobs, backend, initializer, initargs):
+    if backend == 'process':
+        return concurrent.futures.ProcessPoolExecutor(max_workers=n_jobs, initializer=initializer, initargs=initargs,
+                                                      mp_context=multiprocessing.get_context(
+                                                          jcfg.PROCESS_START_METHOD))
+    elif backend == 'thread':
+        return concurrent.futures.ThreadPoolExecutor(max_workers=n_jobs, initializer=initializer, initargs=initargs)
+    raise ValueError(f'unknown backend {backend}, expected thread or process')
+
+
+def _submit(pool, function, a, use_kwargs):
+    return pool.submit(function, **a) if use_kwargs else pool.submit(function, a)
+
+
+def parallel_process(array, function, n_jobs=jcfg.WORKER, use_kwargs=False, front_num=3, use_tqdm=True,
+                     backend='thread', initializer=None, initargs=(), cost=None, timings=None, key=_identity,
+                     deadline=None):
     """
         A parallel version of the map function with a progress bar.
 
@@ -15,10 +132,40 @@ def parallel_process(array, function, n_jobs=jcfg.WORKER, use_kwargs=False, fron
                 keyword arguments to function
             front_num (int, default=3): The number of iterations to run serially before kicking off the parallel job.
                 Useful for catching bugs
+            backend (str, default='thread'): 'thread', or 'process' for CPU-bound functions, which then must be
+                picklable (module level) and are run in jcfg.PROCESS_START_METHOD worker processes
+            initializer (callable, default=None): Called with initargs once in every worker before its first task,
+                eg. to preload reference data shared by all the tasks
+            cost (dict, default=None): Estimated seconds per key(element), eg. TaskHistory.estimates(). The parallel
+                tasks are then submitted longest first so that no long task is left running alone at the end; the
+                results keep the order of array
+            timings (TaskTimings, default=None): Filled with the seconds each task took, keyed on key(element)
+            key (function, default=identity): Name of an element for cost and timings, eg. its ticker
+            deadline (float, default=None): Seconds a parallel task may run, eg. jcfg.TASK_DEADLINE. A task still
+                running after that gets TaskDeadlineExceeded as its result and the job goes on without it
         Returns:
             [function(array[0]), function(array[1]), ...]
             :param use_tqdm:
     """
+    started = time.perf_counter()
+    if timings is not None:
+        timings.n_jobs = n_jobs
+        out = parallel_process(array, _Timed(function), n_jobs, use_kwargs, front_num, use_tqdm, backend,
+                               initializer, initargs, cost, key=key, deadline=deadline)
+        results = []
+        for i, (a, item) in enumerate(zip(array, out)):
+            seconds, result = (deadline, item) if isinstance(item, TaskDeadlineExceeded) else item
+            timings.record(key(a), seconds)
+            # the serial runs raise, as they do without timings
+            if isinstance(result, Exception) and (n_jobs == 1 or i < front_num):
+                raise result
+            results.append(result)
+        timings.wall = time.perf_counter() - started
+        return results
+
+    # The serial runs below happen in this process, so it is initialized like a worker
+    if initializer is not None and (front_num > 0 or n_jobs == 1):
+        initializer(*initargs)
     # We run the first few iterations serially to catch bugs
     front = []
     if front_num > 0:
@@ -30,48 +177,103 @@ def parallel_process(array, function, n_jobs=jcfg.WORKER, use_kwargs=False, fron
         else:
             return front + [function(**a) if use_kwargs else function(a) for a in array[front_num:]]
     # Assemble the workers
-    with concurrent.futures.ThreadPoolExecutor(max_workers=n_jobs) as pool:
+    deadlines = _Deadlines(deadline)
+    pool = create_pool(n_jobs, backend, initializer, initargs)
+    try:
         # Pass the elements of array into function
-        if use_kwargs:
-            futures = [pool.submit(function, **a) for a in array[front_num:]]
-            # futures = {pool.submit(function, **a) for a in array[front_num:]}
-        else:
-            # futures = [pool.submit(function, a) for a in array[front_num:]]
-            futures = {pool.submit(function, a): a for a in array[front_num:]}
-
-        # print(futures)
-        kwargs = {
-            'total': len(futures),
-            'unit': 'it',
-            'unit_scale': True,
-            'leave': True,
-            'ncols': 80
-        }
+        rest = array[front_num:]
+        order = longest_first(rest, cost, key) if cost is not None else range(len(rest))
+        futures = [None] * len(rest)
+        for i in order:
+            futures[i] = _submit(pool, function, rest[i], use_kwargs)
+
         # Print out the progress as tasks complete
-        if use_tqdm:
-            for f in tqdm(concurrent.futures.as_completed(futures), **kwargs):
-                pass
-        else:
-            for f in concurrent.futures.as_completed(futures):
-                pass
+        progress = tqdm(total=len(futures), unit='it', unit_scale=True, leave=True, ncols=80, disable=not use_tqdm)
+        pending = set(futures)
+        while pending:
+            finished = deadlines.wait(pending)
+            pending -= finished
+            progress.update(len(finished))
+        progress.close()
+    finally:
+        deadlines.shutdown(pool)
     out = []
     # Get the results from the futures.
-    if use_tqdm:
-        for i, future in tqdm(enumerate(futures)):
-            try:
-                out.append(future.result())
-            except Exception as e:
-                out.append(e)
-        return front + out
-    else:
-        for i, future in enumerate(futures):
-            try:
-                out.append(future.result())
-            except Exception as e:
-                out.append(e)
-        return front + out
+    for future in futures:
+        try:
+            out.append(deadlines.result(future))
+        except Exception as e:
+            out.append(e)
+    return front + out
 
 
+def parallel_iter(array, function, n_jobs=jcfg.WORKER, window=None, use_kwargs=False, use_tqdm=True,
+                  backend='thread', initializer=None, initargs=(), cost=None, timings=None, key=_identity,
+                  deadline=None):
+    """
+        A streaming version of parallel_process: yields (element, function(element)) as the tasks complete, with the
+        exception raised in place of the result when a task fails.
+
+        At most `window` tasks (n_jobs * PARALLEL_WINDOW_PER_WORKER by default) are in flight, and the next element
+        is only taken from `array` when one completes, so memory stays flat whatever the size of the population and
+        the caller can write each result while the workers carry on. `array` can be any iterable.
+        backend, initializer, initargs, cost, timings, key and deadline are as in parallel_process; with `cost` the
+        elements are taken longest first, so `array` must then be a sequence.
+    """
+    if cost is not None:
+        array = [array[i] for i in longest_first(array, cost, key)]
+    if timings is not None:
+        timings.n_jobs = n_jobs
+        function = _Timed(function)
+    started = time.perf_counter()
+    elements = iter(array)
+    progress = tqdm(total=len(array) if hasattr(array, '__len__') else None, unit='it', unit_scale=True,
+                    leave=True, ncols=80, disable=not use_tqdm)
 
+    def result_of(a, run):
+        try:
+            result = run()
+        except TaskDeadlineExceeded as e:
+            if timings is not None:
+                timings.record(key(a), deadline)
+            return e
+        except Exception as e:
+            return e
+        if timings is None:
+            return result
+        seconds, result = result
+        timings.record(key(a), seconds)
+        return result
 
+    try:
+        # If we set n_jobs to 1, just run them in turn. This is useful for benchmarking and debugging.
+        if n_jobs == 1:
+            if initializer is not None:
+                initializer(*initargs)
+            for a in elements:
+                result = result_of(a, lambda: function(**a) if use_kwargs else function(a))
+                progress.update()
+                yield a, result
+            return
 
+        window = window or n_jobs * jcfg.PARALLEL_WINDOW_PER_WORKER
+        deadlines = _Deadlines(deadline)
+        pool = create_pool(n_jobs, backend, initializer, initargs)
+        pending = {}
+        try:
+            pending = {_submit(pool, function, a, use_kwargs): a for a in itertools.islice(elements, window)}
+            while pending:
+                for future in deadlines.wait(pending):
+                    a = pending.pop(future)
+                    # top the window up before handing the result over
+                    for new in itertools.islice(elements, 1):
+                        pending[_submit(pool, function, new, use_kwargs)] = new
+                    progress.update()
+                    yield a, result_of(a, lambda: deadlines.result(future))
+        finally:
+            # when the caller stopped early, what has not started yet is dropped
+            deadlines.shutdown(pool)
+    finally:
+        progress.close()
+        if timings is not None:
+            timings.wall = time.perf_counter() - started
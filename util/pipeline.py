@@ -0,0 +1,181 @@
+import queue
+import threading
+import time
+from tqdm import tqdm
+from configs import job_configs as jcfg
+from util.parallel_process import create_pool, _Deadlines, TaskDeadlineExceeded
+from util.helper_functions import create_log
+
+_DONE = object()
+
+
+class Stage:
+    """
+        One step of a Pipeline. `function(item, value)` is called by `workers` threads for every item, `value` being
+        what the previous stage returned (the item itself for the first stage). With backend='process' the threads
+        hand the calls to as many worker processes, so the function must be picklable (module level).
+
+        `timings` (a TaskTimings) optionally collects the seconds each item spent in this stage.
+
+        With a `deadline` (seconds, eg. jcfg.TASK_DEADLINE) the calls run in a pool of `workers` threads, and an item
+        still running after that is given up on as in parallel_process: it goes to on_error as a TaskDeadlineExceeded
+        and its worker takes the next item, while the call keeps its pool thread until it returns.
+    """
+
+    def __init__(self, name, function, workers=1, backend='thread', initializer=None, initargs=(), timings=None,
+                 deadline=None):
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.backend = backend
+        self.initializer = initializer
+        self.initargs = initargs
+        self.timings = timings
+        self.deadline = deadline
+        self._lock = threading.Lock()
+        self.items = 0
+        self.errors = 0
+        self.expired = 0
+        self.busy = 0.0
+        self.depth_max = 0
+        self._depth_sum = 0
+        self._depth_samples = 0
+
+    def record(self, item, seconds, ok, expired=False):
+        with self._lock:
+            self.items += 1
+            self.errors += int(not ok)
+            self.expired += int(expired)
+            self.busy += seconds
+        if self.timings is not None:
+            self.timings.record(item, seconds)
+
+    def sample_depth(self, depth):
+        with self._lock:
+            self.depth_max = max(self.depth_max, depth)
+            self._depth_sum += depth
+            self._depth_samples += 1
+
+    def report(self, wall, queue_size):
+        depth = self._depth_sum / self._depth_samples if self._depth_samples else 0.0
+        rate = self.items / wall if wall else 0.0
+        busy = self.busy / (self.workers * wall) if wall else 0.0
+        expired = f", {self.expired} past the deadline" if self.deadline is not None else ''
+        return (f"{self.name}: {self.items} items ({self.errors} failed{expired}) on {self.workers} {self.backend} "
+                f"workers, {rate:.1f}/s, {busy:.0%} busy, queue depth avg {depth:.1f} max "
+                f"{self.depth_max}/{queue_size}")
+
+
+class Pipeline:
+    """
+        Runs items through stages (eg. fetch -> parse -> write), each with its own workers, joined by queues of
+        `queue_size` items. The network, the CPU and the database are then used at the same time, and a slow stage
+        holds the ones before it back instead of piling items up in memory.
+
+        An item whose stage raises leaves the pipeline and is handed to on_error(stage_name, item, exception); what
+        on_error raises itself is logged, the worker carries on.
+    """
+
+    def __init__(self, stages, queue_size=jcfg.PIPELINE_QUEUE_SIZE, on_error=None, use_tqdm=False):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.on_error = on_error
+        self.use_tqdm = use_tqdm
+        self.wall = 0.0
+        self._lock = threading.Lock()
+        self.logger = create_log(loggerName='Pipeline')
+
+    def _work(self, index, queues, pool, remaining, progress):
+        stage = self.stages[index]
+        last_stage = index == len(self.stages) - 1
+        try:
+            while True:
+                entry = queues[index].get()
+                if entry is _DONE:
+                    break
+                item, value = entry
+                start = time.perf_counter()
+                try:
+                    if pool is not None:
+                        result = self._call(pool, stage, item, value)
+                    else:
+                        result = stage.function(item, value)
+                except Exception as e:
+                    stage.record(item, time.perf_counter() - start, ok=False,
+                                 expired=isinstance(e, TaskDeadlineExceeded))
+                    progress.update()
+                    self._error(stage.name, item, e)
+                    continue
+                stage.record(item, time.perf_counter() - start, ok=True)
+                if last_stage:
+                    progress.update()
+                else:
+                    queues[index + 1].put((item, result))
+                    self.stages[index + 1].sample_depth(queues[index + 1].qsize())
+        finally:
+            # a worker that dies still counts as done, or run() would wait for it forever
+            with self._lock:
+                remaining[index] -= 1
+                finished = remaining[index] == 0
+            # the last worker out tells every worker of the next stage there is nothing more to come
+            if finished and not last_stage:
+                for _ in range(self.stages[index + 1].workers):
+                    queues[index + 1].put(_DONE)
+
+    @staticmethod
+    def _call(pool, stage, item, value):
+        future = pool.submit(stage.function, item, value)
+        if stage.deadline is None:
+            return future.result()
+        deadlines = _Deadlines(stage.deadline)
+        while not deadlines.wait({future}):
+            pass
+        return deadlines.result(future)
+
+    def _error(self, stage_name, item, e):
+        if self.on_error is None:
+            return
+        try:
+            self.on_error(stage_name, item, e)
+        except Exception as callback_error:
+            self.logger.error(f"on_error failed for {item} at {stage_name} ({e}): {callback_error}")
+
+    def run(self, items):
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        remaining = [stage.workers for stage in self.stages]
+        pools = [create_pool(stage.workers, stage.backend, stage.initializer, stage.initargs)
+                 if stage.backend == 'process' or stage.deadline is not None else None for stage in self.stages]
+        progress = tqdm(total=len(items) if hasattr(items, '__len__') else None, unit='it', unit_scale=True,
+                        leave=True, ncols=80, disable=not self.use_tqdm)
+        for stage in self.stages:
+            if stage.timings is not None:
+                stage.timings.n_jobs = stage.workers
+        threads = [threading.Thread(target=self._work, args=(index, queues, pools[index], remaining, progress),
+                                    name=f'{stage.name}-{n}', daemon=True)
+                   for index, stage in enumerate(self.stages) for n in range(stage.workers)]
+
+        start = time.perf_counter()
+        try:
+            for thread in threads:
+                thread.start()
+            for item in items:
+                queues[0].put((item, item))
+                self.stages[0].sample_depth(queues[0].qsize())
+            for _ in range(self.stages[0].workers):
+                queues[0].put(_DONE)
+            for thread in threads:
+                thread.join()
+        finally:
+            progress.close()
+            for stage, pool in zip(self.stages, pools):
+                if pool is not None:
+                    # do not wait for the calls that ran past their deadline
+                    pool.shutdown(wait=not stage.expired, cancel_futures=True)
+            self.wall = time.perf_counter() - start
+            for stage in self.stages:
+                if stage.timings is not None:
+                    stage.timings.wall = self.wall
+        return self
+
+    def report(self):
+        return [stage.report(self.wall, self.queue_size) for stage in self.stages]
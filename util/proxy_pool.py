@@ -0,0 +1,105 @@
+import threading
+import time
+from configs import prox_configs as pcfg
+from util.helper_functions import create_log
+
+
+class ProxyState:
+    def __init__(self, url):
+        self.url = url
+        self.in_flight = 0
+        self.latency = None
+        self.error_rate = 0.0
+        self.samples = 0
+        self.quarantined_until = 0
+        self.requests = 0
+        self.errors = 0
+
+
+class ProxyPool:
+    """
+        Spreads requests over several proxies and keeps score of each one.
+
+        Every proxy keeps an exponentially weighted average of its latency and error rate. `acquire` hands out the
+        healthy proxy with the lowest expected wait, (requests in flight + 1) x latency / success rate, so a faster
+        proxy gets a larger share and a stuck one stops being picked. A proxy whose error rate passes `max_error_rate` is
+        taken out of rotation for `quarantine` seconds and then comes back with its error rate halved.
+
+        Args:
+            proxies (list): proxy urls, socks5:// or http://
+    """
+
+    def __init__(self, proxies=None, alpha=pcfg.PROXY_EWMA_ALPHA, max_error_rate=pcfg.PROXY_MAX_ERROR_RATE,
+                 min_samples=pcfg.PROXY_MIN_SAMPLES, quarantine=pcfg.PROXY_QUARANTINE):
+        self.proxies = [ProxyState(url) for url in (pcfg.PROXY_LIST if proxies is None else proxies)]
+        if not self.proxies:
+            raise ValueError('the proxy pool needs at least one proxy')
+        self._by_url = {proxy.url: proxy for proxy in self.proxies}
+        self.alpha = alpha
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.quarantine = quarantine
+        self._lock = threading.Lock()
+        self.logger = create_log(loggerName='ProxyPool')
+
+    def _expected_wait(self, proxy, default_latency):
+        latency = default_latency if proxy.latency is None else proxy.latency
+        # a proxy that fails half the time takes two tries on average
+        return (proxy.in_flight + 1) * latency / max(1 - proxy.error_rate, 0.05)
+
+    def acquire(self, exclude=None) -> str:
+        with self._lock:
+            now = time.monotonic()
+            healthy = [proxy for proxy in self.proxies if proxy.quarantined_until <= now]
+            if exclude is not None and len(healthy) > 1:
+                # eg. a hedged request goes out on another route than the one it duplicates
+                healthy = [proxy for proxy in healthy if proxy.url != exclude] or healthy
+            if not healthy:
+                # every proxy is resting, use the one that comes back first
+                healthy = [min(self.proxies, key=lambda proxy: proxy.quarantined_until)]
+            known = [proxy.latency for proxy in healthy if proxy.latency is not None]
+            # an untried proxy is expected to be as fast as the average one
+            default_latency = sum(known) / len(known) if known else 1.0
+            proxy = min(healthy, key=lambda p: self._expected_wait(p, default_latency))
+            proxy.in_flight += 1
+            proxy.requests += 1
+            return proxy.url
+
+    def release(self, url, latency, ok=True):
+        with self._lock:
+            proxy = self._by_url[url]
+            proxy.in_flight -= 1
+            proxy.samples += 1
+            if ok:
+                proxy.latency = latency if proxy.latency is None else \
+                    self.alpha * latency + (1 - self.alpha) * proxy.latency
+            else:
+                proxy.errors += 1
+            proxy.error_rate = self.alpha * (0.0 if ok else 1.0) + (1 - self.alpha) * proxy.error_rate
+            if proxy.samples >= self.min_samples and proxy.error_rate > self.max_error_rate:
+                proxy.quarantined_until = time.monotonic() + self.quarantine
+                proxy.error_rate /= 2
+                proxy.samples = 0
+                self.logger.warning(f'proxy {url} is out of rotation for {self.quarantine}s after repeated errors')
+
+    def stats(self) -> list:
+        with self._lock:
+            now = time.monotonic()
+            return [{'proxy': proxy.url,
+                     'requests': proxy.requests,
+                     'errors': proxy.errors,
+                     'latency': proxy.latency,
+                     'error_rate': proxy.error_rate,
+                     'quarantined': proxy.quarantined_until > now} for proxy in self.proxies]
+
+
+_proxy_pool = None
+_proxy_pool_lock = threading.Lock()
+
+
+def get_proxy_pool() -> ProxyPool:
+    global _proxy_pool
+    with _proxy_pool_lock:
+        if _proxy_pool is None:
+            _proxy_pool = ProxyPool()
+        return _proxy_pool
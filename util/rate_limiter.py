@@ -0,0 +1,89 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from configs import job_configs as jcfg
+
+
+class TokenBucket:
+    """
+        Token bucket shared by every thread that calls one host.
+
+        `acquire` blocks until a token is available. A throttling response (429/999) pauses the host for the
+        Retry-After period and halves the refill rate, and every successful call adds back a small step of the
+        configured rate, so the sustained rate settles just under the provider's ceiling.
+    """
+
+    def __init__(self, rate, capacity, backoff=jcfg.RATE_LIMIT_BACKOFF, min_factor=jcfg.RATE_LIMIT_MIN_FACTOR):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = rate * min_factor
+        self.capacity = capacity
+        self.backoff = backoff
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+        self._lock = threading.Lock()
+        self.no_throttled = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return None
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def throttled(self, retry_after=None):
+        with self._lock:
+            now = time.monotonic()
+            self.no_throttled += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0
+            self.updated = now
+            self.blocked_until = max(self.blocked_until, now + (self.backoff if retry_after is None else retry_after))
+
+    def succeeded(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.01)
+
+
+def parse_retry_after(value):
+    # Retry-After is either a number of seconds or an HTTP date
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_rate_limiter(host, route=None):
+    """
+        Returns the shared TokenBucket of a host in jcfg.RATE_LIMITS, or None if the host is not limited.
+        The host throttles each client address, so every proxy `route` gets a bucket of its own.
+    """
+    if host not in jcfg.RATE_LIMITS:
+        return None
+    with _buckets_lock:
+        if (host, route) not in _buckets:
+            rate, capacity = jcfg.RATE_LIMITS[host]
+            _buckets[(host, route)] = TokenBucket(rate, capacity)
+        return _buckets[(host, route)]
@@ -1,37 +1,365 @@
 import requests
+from requests.adapters import HTTPAdapter
+import urllib3
+from urllib3.util.request import ACCEPT_ENCODING
+from urllib3.util.connection import is_connection_dropped
 import random
+import queue
+import threading
+import time
+import collections
+import concurrent.futures
+from contextlib import contextmanager
 from configs import job_configs as jcfg
-from configs import prox_configs as pcfg
 from configs import finviz_configs as fcfg
-from util.finviz_cnv_str_to_num import convert_str_to_num
+from util.finviz_cnv_str_to_num import convert_columns
+from util.http_cache import get_response_cache, get_validator_store
+from util import json_decoder
+from util.rate_limiter import get_rate_limiter, parse_retry_after
+from util.proxy_pool import get_proxy_pool
+from urllib.parse import urlsplit
 import json
-from bs4 import BeautifulSoup
 import re
+import lxml.html
 import pandas as pd
-import numpy as np
 
 
 class WebParseError(Exception):
     pass
 
 
-class GetWebsite:
+class WebThrottledError(WebParseError):
+    pass
+
+
+class CircuitOpenError(WebParseError):
+    pass
 
-    def __init__(self, url, proxy=True):
+
+class NotModified(Exception):
+    """The server answered 304 to a conditional request, `payload` is what the caller stored with the validators"""
+
+    def __init__(self, url, payload=None):
+        super().__init__(f'{url} is not modified')
         self.url = url
-        self.proxy = proxy
-        self.no_requests = 0
+        self.payload = payload
+
+
+class CircuitBreaker:
+    """
+        Per-host circuit breaker.
+
+        After `threshold` consecutive failures (connection errors or 5xx) the circuit opens and every request to
+        the host fails fast with CircuitOpenError. Once `cooldown` seconds have passed it goes half-open and lets
+        `trial_requests` through: a success closes the circuit, a failure opens it again.
+    """
+
+    def __init__(self, host, threshold=jcfg.CIRCUIT_FAILURE_THRESHOLD, cooldown=jcfg.CIRCUIT_COOLDOWN,
+                 trial_requests=jcfg.CIRCUIT_HALF_OPEN_TRIALS):
+        self.host = host
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.trial_requests = trial_requests
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0
+        self.trials = 0
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    raise CircuitOpenError(f'circuit is open for {self.host}')
+                self.state = 'half_open'
+                self.trials = 0
+            if self.state == 'half_open':
+                if self.trials >= self.trial_requests:
+                    raise CircuitOpenError(f'circuit is half-open for {self.host}, waiting on trial requests')
+                self.trials += 1
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.threshold:
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def cooldown_remaining(self):
+        with self._lock:
+            if self.state != 'open':
+                return 0
+            return max(0, self.cooldown - (time.monotonic() - self.opened_at))
+
+
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(host) -> CircuitBreaker:
+    with _circuit_breakers_lock:
+        if host not in _circuit_breakers:
+            _circuit_breakers[host] = CircuitBreaker(host)
+        return _circuit_breakers[host]
+
+
+def circuit_cooldown_remaining():
+    """seconds until every open circuit lets trial requests through again"""
+    with _circuit_breakers_lock:
+        breakers = list(_circuit_breakers.values())
+    return max([breaker.cooldown_remaining() for breaker in breakers] + [0])
+
+
+class LatencyTracker:
+    """
+        Recent response latencies (seconds to the headers) of one host.
+
+        `hedge_delay` is their HEDGE_QUANTILE, after which a request still waiting is worth duplicating, or None
+        until HEDGE_MIN_SAMPLES latencies have been seen.
+    """
+
+    def __init__(self, host, window=jcfg.HEDGE_WINDOW, quantile=jcfg.HEDGE_QUANTILE,
+                 min_samples=jcfg.HEDGE_MIN_SAMPLES):
+        self.host = host
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self._latencies = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def record(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def hedge_delay(self):
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[int(self.quantile * (len(latencies) - 1))]
+
+    def record_hedge(self, won):
+        with self._lock:
+            self.hedged += 1
+            self.hedge_wins += int(won)
+
+
+_latency_trackers = {}
+_latency_trackers_lock = threading.Lock()
+_hedge_executor = None
+
+
+def get_latency_tracker(host) -> LatencyTracker:
+    with _latency_trackers_lock:
+        if host not in _latency_trackers:
+            _latency_trackers[host] = LatencyTracker(host)
+        return _latency_trackers[host]
+
+
+def get_hedge_executor() -> concurrent.futures.ThreadPoolExecutor:
+    # runs both legs of hedged requests, the calling thread waits for the first response
+    global _hedge_executor
+    with _latency_trackers_lock:
+        if _hedge_executor is None:
+            _hedge_executor = concurrent.futures.ThreadPoolExecutor(max_workers=jcfg.WORKER * 2,
+                                                                    thread_name_prefix='hedge')
+        return _hedge_executor
+
+
+def hedge_stats() -> dict:
+    with _latency_trackers_lock:
+        trackers = list(_latency_trackers.values())
+    return {'hedged': sum(tracker.hedged for tracker in trackers),
+            'hedge_wins': sum(tracker.hedge_wins for tracker in trackers)}
+
+
+class _CountingReader:
+    """File-like wrapper that counts the bytes read through it"""
+
+    def __init__(self, fp):
+        self._fp = fp
+        self.bytes_read = 0
+
+    def read(self, *args):
+        data = self._fp.read(*args)
+        self.bytes_read += len(data)
+        return data
+
+    def read1(self, *args):
+        data = self._fp.read1(*args)
+        self.bytes_read += len(data)
+        return data
+
+    def readline(self, *args):
+        data = self._fp.readline(*args)
+        self.bytes_read += len(data)
+        return data
+
+    def readinto(self, b):
+        n = self._fp.readinto(b)
+        self.bytes_read += n or 0
+        return n
+
+    def __getattr__(self, item):
+        return getattr(self._fp, item)
+
+
+class SharedCounter:
+    """Counter that can be added to from many threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def add(self, n=1):
+        with self._lock:
+            self.value += n
+
+
+class TransferStats:
+    """
+        Bytes transferred by every GetWebsite request, in total and per endpoint (jcfg.TRANSFER_ENDPOINTS).
+
+        `wire` is the body as it came off the socket (compressed, chunk framing included) and `decoded` what the
+        parsers read after decompression, so wire/decoded shows whether compression is in effect.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.responses = 0
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+        self.not_modified = 0
+        self.endpoints = {}
+
+    @staticmethod
+    def endpoint(url):
+        for endpoint in jcfg.TRANSFER_ENDPOINTS:
+            if endpoint in url:
+                return endpoint
+        return urlsplit(url).hostname
+
+    def record(self, url, wire, decoded, not_modified=False):
+        endpoint = self.endpoint(url)
+        with self._lock:
+            self.responses += 1
+            self.wire_bytes += wire
+            self.decoded_bytes += decoded
+            self.not_modified += not_modified
+            stats = self.endpoints.setdefault(endpoint, {'responses': 0, 'wire_bytes': 0, 'decoded_bytes': 0,
+                                                         'not_modified': 0})
+            stats['responses'] += 1
+            stats['wire_bytes'] += wire
+            stats['decoded_bytes'] += decoded
+            stats['not_modified'] += not_modified
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {'responses': self.responses,
+                    'wire_bytes': self.wire_bytes,
+                    'decoded_bytes': self.decoded_bytes,
+                    'not_modified': self.not_modified,
+                    'endpoints': {k: dict(v) for k, v in self.endpoints.items()}}
+
+
+_transfer_stats = TransferStats()
+
+
+def record_transfer(url, wire, decoded, not_modified=False):
+    _transfer_stats.record(url, wire, decoded, not_modified)
+
+
+def transfer_stats() -> dict:
+    return _transfer_stats.snapshot()
+
+
+def transfer_report(end, start=None) -> str:
+    """The transfer between two transfer_stats() snapshots as lines for the job summary"""
+    start = start or {'responses': 0, 'wire_bytes': 0, 'decoded_bytes': 0, 'not_modified': 0, 'endpoints': {}}
+
+    def line(name, now, before):
+        wire = now['wire_bytes'] - before.get('wire_bytes', 0)
+        decoded = now['decoded_bytes'] - before.get('decoded_bytes', 0)
+        ratio = f'{wire / decoded:.0%}' if decoded else 'n/a'
+        return (f"{name}: {now['responses'] - before.get('responses', 0)} responses "
+                f"({now['not_modified'] - before.get('not_modified', 0)} not modified), "
+                f"{wire / 1024 ** 2:.1f} MB on the wire, {decoded / 1024 ** 2:.1f} MB decoded ({ratio}) \n")
+
+    lines = [line('Transfer', end, start)]
+    for endpoint, stats in sorted(end['endpoints'].items()):
+        lines.append('    ' + line(endpoint, stats, start['endpoints'].get(endpoint, {})))
+    return ''.join(lines)
+
+
+class _CountingAdapter(HTTPAdapter):
+    """HTTPAdapter that reports whether each request opened a new connection or re-used a pooled one"""
+
+    def __init__(self, session_pool, **kwargs):
+        self.session_pool = session_pool
+        super().__init__(**kwargs)
+
+    def _opened_connections(self):
+        # urllib3 keeps a running count of the connections each host pool has opened
+        managers = [self.poolmanager] + list(self.proxy_manager.values())
+        return sum(manager.pools[key].num_connections for manager in managers for key in manager.pools.keys())
+
+    def _dropped_connections(self, request, kwargs):
+        # a pooled connection whose socket is gone (eg. a streamed body closed part way) connects again on its next
+        # request, which urllib3 does not count as a new connection
+        try:
+            pool = self.get_connection_with_tls_context(request, kwargs.get('verify', True), kwargs.get('proxies'),
+                                                        kwargs.get('cert'))
+            return sum(1 for conn in list(pool.pool.queue) if conn is not None and is_connection_dropped(conn))
+        except Exception:
+            return 0
+
+    def send(self, request, **kwargs):
+        opened = self._opened_connections() - self._dropped_connections(request, kwargs)
+        response = super().send(request, **kwargs)
+        self.session_pool.record(self._opened_connections() - opened)
+        # the headers are read, count the body bytes from here on as they come off the socket
+        try:
+            response.raw._fp.fp = response.wire = _CountingReader(response.raw._fp.fp)
+        except AttributeError:
+            response.wire = None
+        return response
+
 
-    def _get_session(self):
+class SessionPool:
+    """
+        A bounded pool of keep-alive sessions for one proxy route.
+
+        Sessions are handed out LIFO so the warmest connections are re-used first, and a caller blocks
+        when all `pool_size` sessions are checked out. Each session keeps its user agent for its lifetime.
+    """
+
+    def __init__(self, proxy_url=None, pool_size=jcfg.SESSION_POOL_SIZE):
+        self.proxy_url = proxy_url
+        self.pool_size = pool_size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self.new_connections = 0
+        self.reused_connections = 0
+
+    def _new_session(self):
         session = requests.session()
-        self.no_requests += 1
-        if self.proxy:
-            session.proxies = {'http': 'socks5://{}:{}'.format(pcfg.PROXY_URL, pcfg.PROXY_PROT),
-                               'https': 'socks5://{}:{}'.format(pcfg.PROXY_URL, pcfg.PROXY_PROT)}
+        adapter = _CountingAdapter(self, pool_connections=jcfg.SESSION_POOL_HOSTS, pool_maxsize=1)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if self.proxy_url is not None:
+            session.proxies = {'http': self.proxy_url, 'https': self.proxy_url}
         session.headers = {
             'user-agent': random.choice(jcfg.UA_LIST),
             'Accept-Language': 'en-GB,en;q=0.9,en-US;q=0.8,zh-CN;q=0.7,zh;q=0.6,zh-TW;q=0.5',
             'Cache-Control': 'no-cache',
+            'Accept-Encoding': ACCEPT_ENCODING,
             'Connection': 'keep-alive',
             'Sec-Fetch-Dest': 'iframe',
             'Sec-Fetch-Mode': 'navigate',
@@ -40,44 +368,376 @@ class GetWebsite:
         }
         return session
 
-    def _get_response(self):
-        session = self._get_session()
+    def checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.pool_size
+                if create:
+                    self._created += 1
+            return self._new_session() if create else self._idle.get()
+
+    def checkin(self, session):
+        self._idle.put(session)
+
+    @contextmanager
+    def session(self):
+        session = self.checkout()
+        try:
+            yield session
+        finally:
+            self.checkin(session)
+
+    def record(self, new_connections):
+        with self._lock:
+            if new_connections > 0:
+                self.new_connections += new_connections
+            else:
+                self.reused_connections += 1
+
+
+_session_pools = {}
+_session_pools_lock = threading.Lock()
+
+
+def get_session_pool(proxy_url=None) -> SessionPool:
+    with _session_pools_lock:
+        if proxy_url not in _session_pools:
+            _session_pools[proxy_url] = SessionPool(proxy_url=proxy_url)
+        return _session_pools[proxy_url]
+
+
+def _close_streamed(response, release):
+    """
+        Makes response.close() of a streamed response read the rest of the body when it is at most
+        STREAM_DRAIN_BYTES, so that urllib3 keeps its connection alive, and then call release() (once), eg. to hand
+        the session holding the connection back to its pool.
+    """
+    close = response.close
+    lock = threading.Lock()
+    released = []
+
+    def closing():
+        try:
+            remaining = jcfg.STREAM_DRAIN_BYTES
+            while remaining > 0 and not response.raw.closed:
+                data = response.raw.read(min(remaining, jcfg.STREAM_CHUNK_SIZE), decode_content=False)
+                if not data:
+                    break
+                remaining -= len(data)
+        except Exception:
+            pass
+        finally:
+            close()
+            with lock:
+                first = not released
+                released.append(True)
+            if first:
+                release()
+
+    response.close = closing
+
+
+def connection_stats() -> dict:
+    with _session_pools_lock:
+        pools = list(_session_pools.values())
+    return {'new_connections': sum(pool.new_connections for pool in pools),
+            'reused_connections': sum(pool.reused_connections for pool in pools)}
+
+
+class GetWebsite:
+    # subclasses whose responses may be served from the on-disk cache when jcfg.HTTP_CACHE_ENABLED
+    use_cache = False
+
+    def __init__(self, url, proxy=True, cache=None, conditional=False, hedge=None):
+        self.url = url
+        self.proxy = proxy
+        self.cache = self.use_cache and jcfg.HTTP_CACHE_ENABLED if cache is None else cache
+        # duplicate a request that is slower than the host's HEDGE_QUANTILE latency, see _send_hedged
+        self.hedge = jcfg.HEDGE_REQUESTS if hedge is None else hedge
+        # send the stored ETag / Last-Modified, a 304 is raised as NotModified
+        self.conditional = conditional
+        self.validators = None
+        # the legs of a hedged request are sent from two threads
+        self._requests = SharedCounter()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def no_requests(self):
+        return self._requests.value
+
+    def _conditional_headers(self):
+        if not self.conditional:
+            return None
+        stored = get_validator_store().get(self.url)
+        if stored is None:
+            return None
+        headers = {}
+        if stored['etag']:
+            headers['If-None-Match'] = stored['etag']
+        if stored['last_modified']:
+            headers['If-Modified-Since'] = stored['last_modified']
+        return headers or None
+
+    def commit_validators(self, payload: bytes = None):
+        """
+            Store the validators of the last 200 response. Call it once the page's data is safely written,
+            so a failed write is downloaded again next time instead of being answered with 304.
+        """
+        if self.validators is not None:
+            get_validator_store().put(self.url, self.validators[0], self.validators[1], payload)
+
+    def _cached_response(self, body):
+        response = requests.Response()
+        response.status_code = 200
+        response.url = self.url
+        response.encoding = 'utf-8'
+        response._content = body
+        response._content_consumed = True
+        response.from_cache = True
+        return response
+
+    def _get_response(self, stream=False):
+        if self.cache:
+            body = get_response_cache().get(self.url)
+            if body is not None:
+                self.cache_hits += 1
+                return self._cached_response(body)
+            self.cache_misses += 1
+
+        response = self._fetch(stream)
+        if stream and response.status_code != 200:
+            # only a 200 body is streamed to the caller, any other is read here and its session handed back
+            try:
+                decoded = len(response.content)
+            except requests.exceptions.RequestException as e:
+                raise WebParseError(f'unable to parse url = {self.url} due to {e}')
+            finally:
+                response.close()
+            self._record_transfer(response, decoded, not_modified=response.status_code == 304)
+        if response.status_code == 304 and self.conditional:
+            stored = get_validator_store().get(self.url)
+            raise NotModified(self.url, stored['payload'] if stored else None)
+        if self.conditional and response.status_code == 200:
+            etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+            self.validators = (etag, last_modified) if etag or last_modified else None
+        # a streamed body is read by the caller, which stores what it consumed
+        if self.cache and not stream and response.status_code == 200:
+            get_response_cache().put(self.url, response.content)
+        return response
+
+    def _fetch(self, stream=False):
+        host = urlsplit(self.url).hostname
+        breaker = get_circuit_breaker(host)
+        breaker.before_request()
+        proxy_pool = get_proxy_pool() if self.proxy else None
+        # a request that does not get through is tried once more, on another proxy when there is one
+        attempts = min(2, len(proxy_pool.proxies)) if proxy_pool is not None else 1
+        for attempt in range(attempts):
+            proxy_url = proxy_pool.acquire() if proxy_pool is not None else None
+            limiter = get_rate_limiter(host, proxy_url)
+            if limiter is not None:
+                limiter.acquire()
+            start = time.monotonic()
+            try:
+                if self.hedge:
+                    response = self._send_hedged(host, proxy_pool, proxy_url, stream)
+                else:
+                    response = self._send(proxy_url, stream)
+                break
+            except WebParseError:
+                if proxy_pool is not None:
+                    proxy_pool.release(proxy_url, time.monotonic() - start, ok=False)
+                if attempt == attempts - 1:
+                    breaker.record_failure()
+                    raise
+        if proxy_pool is not None:
+            # the host throttles the exit address, so a throttled proxy counts as failing
+            proxy_pool.release(proxy_url, time.monotonic() - start,
+                               ok=response.status_code not in jcfg.THROTTLE_STATUS)
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        if limiter is not None:
+            if response.status_code in jcfg.THROTTLE_STATUS:
+                limiter.throttled(parse_retry_after(response.headers.get('Retry-After')))
+            else:
+                limiter.succeeded()
+        return response
+
+    def _send_hedged(self, host, proxy_pool, proxy_url, stream=False):
+        """
+            Send on `proxy_url` and, when no response has come after the host's hedge delay, send the same request
+            again on another proxy (or another keep-alive connection of the same route) and return whichever
+            response comes first. The other one is closed when it arrives.
+        """
+        tracker = get_latency_tracker(host)
+        delay = tracker.hedge_delay()
+        executor = get_hedge_executor()
+        start = time.monotonic()
+        primary = executor.submit(self._send, proxy_url, stream)
         try:
-            response = session.get(self.url, allow_redirects=False)
+            response = primary.result(timeout=delay)
+            tracker.record(time.monotonic() - start)
             return response
+        except concurrent.futures.TimeoutError:
+            pass
+
+        hedge_proxy = proxy_pool.acquire(exclude=proxy_url) if proxy_pool is not None else None
+        limiter = get_rate_limiter(host, hedge_proxy)
+        if limiter is not None:
+            limiter.acquire()
+        hedge_start = time.monotonic()
+        hedge = executor.submit(self._send, hedge_proxy, stream)
+        if proxy_pool is not None:
+            hedge.add_done_callback(lambda f: proxy_pool.release(hedge_proxy, time.monotonic() - hedge_start,
+                                                                 ok=f.exception() is None))
+
+        error = None
+        for future in concurrent.futures.as_completed([primary, hedge]):
+            if future.exception() is not None:
+                error = future.exception()
+                continue
+            tracker.record(time.monotonic() - start)
+            tracker.record_hedge(won=future is hedge)
+            other = primary if future is hedge else hedge
+            other.add_done_callback(lambda f: f.exception() is None and f.result().close())
+            return future.result()
+        raise error
+
+    def _record_transfer(self, response, decoded, not_modified=False):
+        wire = getattr(response, 'wire', None)
+        record_transfer(self.url, decoded if wire is None else wire.bytes_read, decoded, not_modified)
+
+    def _send(self, proxy_url=None, stream=False):
+        self._requests.add()
+        # sessions stick to one proxy, so their keep-alive connections stay on that route
+        headers = self._conditional_headers()
+        timeout = (jcfg.HTTP_CONNECT_TIMEOUT, jcfg.HTTP_READ_TIMEOUT)
+        session_pool = get_session_pool(proxy_url)
+        session = session_pool.checkout()
+        response = None
+        try:
+            response = session.get(self.url, allow_redirects=False, stream=stream, headers=headers, timeout=timeout)
         except requests.exceptions.ConnectTimeout:
-            response = session.get(self.url, allow_redirects=True)
-            return response
+            try:
+                response = session.get(self.url, allow_redirects=True, stream=stream, headers=headers,
+                                       timeout=timeout)
+            except requests.exceptions.RequestException as e:
+                raise WebParseError(f'unable to parse url = {self.url} due to {e}')
         except requests.exceptions.HTTPError as e:
             raise WebParseError(f'unable to parse url = {self.url} due to {e}')
         except requests.exceptions.RequestException as e:
             raise WebParseError(f'unable to parse url = {self.url} due to {e}')
         except Exception as e:
             raise WebParseError(f'unable to parse url = {self.url} due to {e}')
+        finally:
+            if response is None or not stream:
+                session_pool.checkin(session)
+            else:
+                # the session's only connection to the host is busy until the streamed body is closed
+                _close_streamed(response, lambda: session_pool.checkin(session))
+        # a streamed body is recorded by the caller once it has been read
+        if not stream:
+            self._record_transfer(response, len(response.content), not_modified=response.status_code == 304)
+        return response
 
-    def response(self):
-        return self._get_response()
+    def response(self, stream=False):
+        return self._get_response(stream)
+
+
+class EmbeddedJSONScanner:
+    """
+        Finds the JSON blob of the `-- Data --` script in a Yahoo page as the bytes arrive.
+
+        The blob starts at `{"context"` after the marker and the script ends at `</script>`, so `feed` returns True
+        as soon as the whole script has been read and the rest of the page does not need to be downloaded.
+        The bytes before the marker are dropped as they are scanned.
+    """
+    DATA_MARKER = b'-- Data --'
+    JSON_START = b'"context"'
+    SCRIPT_END = b'</script>'
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.found_marker = False
+        self.start = -1
+        self.end = -1
+        self._pos = 0
+
+    def feed(self, chunk) -> bool:
+        self.buffer += chunk
+        if not self.found_marker:
+            idx = self.buffer.find(self.DATA_MARKER)
+            if idx < 0:
+                # keep the tail in case the marker is split across two chunks
+                del self.buffer[:-(len(self.DATA_MARKER) - 1)]
+                return False
+            del self.buffer[:idx]
+            self.found_marker = True
+        if self.start < 0:
+            idx = self.buffer.find(self.JSON_START, self._pos)
+            if idx < 0:
+                self._pos = max(0, len(self.buffer) - len(self.JSON_START) + 1)
+                return False
+            # the blob opens with the brace right before "context"
+            self.start = idx - 1
+            self._pos = idx
+        idx = self.buffer.find(self.SCRIPT_END, self._pos)
+        if idx < 0:
+            self._pos = max(self.start, len(self.buffer) - len(self.SCRIPT_END) + 1)
+            return False
+        self.end = idx
+        return True
+
+    @property
+    def complete(self):
+        return self.end >= 0
+
+    @property
+    def consumed(self) -> bytes:
+        # the scanned part of the page from the marker on, enough to find the blob again
+        return bytes(self.buffer[:self.end + len(self.SCRIPT_END)])
+
+    def result(self):
+        if not self.complete:
+            return None
+        # raw_decode stops at the end of the object and ignores the script's trailing `;}(this));`
+        text = self.buffer[self.start:self.end].decode('utf-8')
+        return json.JSONDecoder().raw_decode(text)[0]
 
 
 class YahooWebParser(GetWebsite):
+    use_cache = True
+
     def _parse_html_for_json(self):
-        resp = self.response()
+        resp = self.response(stream=True)
         if resp is None:
             raise WebParseError(f'Response is empty for {self.url}')
         elif resp.status_code == 200:
-            soup = BeautifulSoup(resp.text, 'html.parser')
-            pattern = re.compile(r'\s--\sData\s--\s')
+            scanner = EmbeddedJSONScanner()
+            decoded = 0
             try:
-                script_data = soup.find('script', text=pattern).contents[0]
-                start = script_data.find("context") - 2
-                if start >= 0:
-                    json_data = json.loads(script_data[start:-12])
-                else:
-                    json_data = None
-                return json_data
-            except AttributeError as e:
+                for chunk in resp.iter_content(chunk_size=jcfg.STREAM_CHUNK_SIZE):
+                    decoded += len(chunk)
+                    if scanner.feed(chunk):
+                        break
+            except requests.exceptions.RequestException as e:
+                raise WebParseError(f'unable to parse url = {self.url} due to {e}')
+            finally:
+                # stop the download once the data script is complete
+                resp.close()
+                if not getattr(resp, 'from_cache', False):
+                    self._record_transfer(resp, decoded)
+            if not scanner.found_marker:
                 raise WebParseError(
                     f'Attribution error {resp.status_code} for {self.url}')
+            if self.cache and scanner.complete and not getattr(resp, 'from_cache', False):
+                get_response_cache().put(self.url, scanner.consumed)
+            return scanner.result()
         else:
             raise WebParseError(
                 f'Response status code is {resp.status_code} for {self.url}')
@@ -86,48 +746,115 @@ class YahooWebParser(GetWebsite):
         for trail in range(5):
             js = self._parse_html_for_json()
             if js is not None:
-                return self._parse_html_for_json()
+                return js
 
 
 class YahooAPIParser(GetWebsite):
+    use_cache = True
+
+    def __init__(self, url, proxy=True, cache=None, stream_path=None):
+        super().__init__(url, proxy=proxy, cache=cache)
+        # decode only the array at this path (eg. 'timeseries.result') while the body streams in
+        self.stream_path = stream_path
+
+    def _decode(self, resp):
+        try:
+            if self.stream_path is not None and not getattr(resp, 'from_cache', False):
+                resp.raw.decode_content = True
+                body = _CountingReader(resp.raw)
+                try:
+                    return json_decoder.load_items(body, self.stream_path)
+                finally:
+                    resp.close()
+                    self._record_transfer(resp, body.bytes_read)
+            return json_decoder.loads(resp.content)
+        except json_decoder.JSONDecodeError as e:
+            raise WebParseError(f'unable to decode the response of {self.url} due to {e}')
+        except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError) as e:
+            raise WebParseError(f'unable to parse url = {self.url} due to {e}')
+
     def _parse_for_json(self):
-        resp = self.response()
+        # a cached body is needed whole, so only stream when the cache is off
+        resp = self.response(stream=self.stream_path is not None and not self.cache)
         if resp is None:
             raise WebParseError(f'Response is empty for {self.url}')
         elif resp.status_code == 200:
-            return json.loads(resp.text)
+            return self._decode(resp)
+        elif resp.status_code in jcfg.THROTTLE_STATUS:
+            raise WebThrottledError(
+                f'Response status code is {resp.status_code} for {self.url}')
         else:
             raise WebParseError(
                 f'Response status code is {resp.status_code} for {self.url}')
 
     def parse(self):
         for trail in range(5):
-            js = self._parse_for_json()
+            try:
+                js = self._parse_for_json()
+            except WebThrottledError:
+                # the host's rate limiter holds the next attempt until the back-off has passed
+                if trail == 4:
+                    raise
+                continue
             if js is not None:
                 return js
         return None
 
 
 class FinvizParserPerPage(GetWebsite):
+    """
+        One screener page of Finviz, fetched once and read with targeted XPath for both the table and the count.
+
+        The screener table is the table whose first row holds the `Ticker` header and the count is the
+        `td.count-text` cell ("Total: 8923 #1"). When the layout does not match, the same document falls back to
+        pd.read_html with the original table positions.
+    """
+    TABLE_XPATH = "//table[(tr|tbody/tr)[1]/td[normalize-space(.)='Ticker']]"
+    COUNT_XPATH = "//td[contains(concat(' ', normalize-space(@class), ' '), ' count-text ')]"
+    COUNT_PATTERN = re.compile(r'Total:\s*(\d+)')
+
+    def __init__(self, url, proxy=True, cache=None, conditional=False):
+        super().__init__(url, proxy=proxy, cache=cache, conditional=conditional)
+        self._html = None
+        self._tree = None
+
+    def _document(self):
+        if self._tree is None:
+            self._html = self.response().text
+            self._tree = lxml.html.fromstring(self._html)
+        return self._tree
+
+    @staticmethod
+    def _cell_text(cell):
+        # the same whitespace clean-up as pd.read_html
+        return re.sub(r'[\r\n]+|\s{2,}', ' ', cell.text_content()).strip()
+
+    def _read_table(self):
+        tables = self._document().xpath(self.TABLE_XPATH)
+        if tables:
+            rows = tables[-1].xpath('tr|tbody/tr')
+            return pd.DataFrame([[self._cell_text(td) for td in row.xpath('td|th')] for row in rows])
+        return pd.read_html(self._html)[8]
+
     def parse_for_df(self):
-        df = pd.read_html(self.response().text)[8]
+        df = self._read_table()
 
         if df.shape[1] == 70:
             df.columns = df.iloc[0]
             df = df.iloc[1:]
-            df.replace(to_replace='-', value=np.NaN, inplace=True)
-            df.rename(columns=fcfg.COL_RENAMES, inplace=True)
-            for column in df.columns:
-                df[column] = df[column].apply(convert_str_to_num)
-            df['ipo_date'] = pd.to_datetime(df['ipo_date'], format='%m/%d/%Y')
-            return df
+            df = df.rename(columns=fcfg.COL_RENAMES)
+            return convert_columns(df)
         else:
             return pd.DataFrame()
 
     @property
     def no_of_population(self):
-        df = pd.read_html(self.response().text)[7]
+        for cell in self._document().xpath(self.COUNT_XPATH):
+            match = self.COUNT_PATTERN.search(cell.text_content())
+            if match:
+                return int(match.group(1))
 
+        df = pd.read_html(self._html)[7]
         if df.shape[0] == 1:
             return int(df[0][0].split(' ')[1])
         else:
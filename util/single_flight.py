@@ -0,0 +1,44 @@
+import threading
+
+
+class SingleFlight:
+    """
+        Process-wide memo where concurrent callers of the same key wait on one in-flight load and share its result.
+
+        A load that raises is not memoized: the exception goes to the caller that ran it and the callers waiting on
+        it load again. The shared results must be treated as read-only.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results = {}
+        self._in_flight = {}
+        self.hits = 0
+        self.loads = 0
+
+    def get(self, key, loader):
+        while True:
+            with self._lock:
+                if key in self._results:
+                    self.hits += 1
+                    return self._results[key]
+                event = self._in_flight.get(key)
+                if event is None:
+                    event = self._in_flight[key] = threading.Event()
+                    self.loads += 1
+                    break
+            event.wait()
+
+        try:
+            value = loader()
+            with self._lock:
+                self._results[key] = value
+            return value
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            event.set()
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
@@ -0,0 +1,44 @@
+import sqlite3
+import threading
+import time
+from configs import job_configs as jcfg
+
+
+class TaskHistory:
+    """
+        Seconds each task of a job took (eg. per ticker), kept across runs as an exponentially weighted average in a
+        SQLite file, so that parallel_process / parallel_iter can schedule the longest tasks first.
+    """
+
+    def __init__(self, job, path=jcfg.TASK_HISTORY_PATH, alpha=jcfg.TASK_HISTORY_ALPHA):
+        self.job = job
+        self.path = path
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS task_seconds (
+                                job TEXT,
+                                task TEXT,
+                                seconds REAL,
+                                runs INTEGER,
+                                updated_at REAL,
+                                PRIMARY KEY (job, task))""")
+
+    def estimates(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute('SELECT task, seconds FROM task_seconds WHERE job = ?', (self.job,)).fetchall()
+        return dict(rows)
+
+    def update(self, durations: dict):
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN')
+            for task, seconds in durations.items():
+                self._conn.execute('INSERT INTO task_seconds (job, task, seconds, runs, updated_at) '
+                                   'VALUES (?, ?, ?, 1, ?) '
+                                   'ON CONFLICT (job, task) DO UPDATE SET '
+                                   'seconds = ? * excluded.seconds + (1 - ?) * seconds, runs = runs + 1, '
+                                   'updated_at = excluded.updated_at',
+                                   (self.job, str(task), seconds, now, self.alpha, self.alpha))
+            self._conn.execute('COMMIT')
@@ -1,32 +1,11 @@
-from sqlalchemy import create_engine
 import pandas as pd
-import configs.database_configs_nas as dcf_nas
-import configs.database_configs_prod as dcf_prod
+from util.db_engine import Engine
 from util.helper_functions import create_log
 
 
 class UploadData2GCP:
-    database_ip = dcf_nas.MYSQL_HOST
-    database_user = dcf_nas.MYSQL_USER
-    database_pw = dcf_nas.MYSQL_PASSWORD
-    database_port = dcf_nas.MYSQL_PORT
-    database_nm = dcf_nas.MYSQL_DATABASE
-
-    database_ip_prd = dcf_prod.MYSQL_HOST
-    database_user_prd = dcf_prod.MYSQL_USER
-    database_pw_prd = dcf_prod.MYSQL_PASSWORD
-    database_port_prd = dcf_prod.MYSQL_PORT
-    database_nm_prd = dcf_prod.MYSQL_DATABASE
-
-    cnn_from = create_engine(
-        f'mysql+mysqlconnector://{database_user}:{database_pw}@{database_ip}:{database_port}/{database_nm}',
-        pool_size=20,
-        max_overflow=0)
-
-    cnn_to = create_engine(
-        f'mysql+mysqlconnector://{database_user_prd}:{database_pw_prd}@{database_ip_prd}:{database_port_prd}/{database_nm_prd}',
-        pool_size=20,
-        max_overflow=0)
+    cnn_from = Engine('nas')
+    cnn_to = Engine('prod')
 
     def __init__(self, table_to_upload: list, loggerFileName=None):
         self.table_to_upload = table_to_upload
@@ -3,6 +3,7 @@ import datetime
 from util.transfer_data import UploadData2GCP
 from util.helper_functions import create_log
 from util.send_email import SendEmail
+from util.request_website import connection_stats, transfer_stats, transfer_report
 import sys
 
 
@@ -25,14 +26,19 @@ def main(run_time):
                             targeted_pop='YAHOO_STOCK_ALL',
                             batch=True,
                             loggerFileName=loggerFileName,
-                            use_tqdm=True)
+                            use_tqdm=True,
+                            incremental=True)
     spider.run()
+    conn = connection_stats()
 
     SendEmail(content=f"""{'-'*80}\n"""
                       f'Weekly Yahoo Equity Financial Statement job finished for {run_time}\n'
                       f"""{'-'*80}\n"""
                       f"""{spider.get_failed_extracts}/{spider.no_of_stock} Failed Extractions. \n"""
+                      f"""{spider.get_deferred_extracts} Deferred Extractions (circuit open). \n"""
                       f"""The job made {spider.no_of_web_calls} calls through the internet. \n"""
+                      f"""Connections: {conn['new_connections']} opened, {conn['reused_connections']} re-used. \n"""
+                      f"""{transfer_report(transfer_stats())}"""
                       f"""The job made {spider.no_of_db_entries} entries to the database"""
                       f"""Target Table: yahoo_annual_fundamental\n"""
                       f"""              yahoo_quarterly_fundamental\n"""
@@ -1,9 +1,11 @@
 from configs import job_configs as jcfg
-from util.parallel_process import parallel_process
+from util.parallel_process import parallel_process, TaskTimings
+from util.task_history import TaskHistory
 from util.helper_functions import create_log, dedup_list, returnNotMatches
 from util.create_output_sqls import write_insert_db
 from util.gcp_functions import upload_to_bucket
 from util.database_management import DatabaseManagement, DatabaseManagementError
+from util.batch_writer import flush_batch_writer, PendingWrites
 from util.get_stock_population import StockPopulation
 from modules.extract_yahoo_price import YahooPrice
 from datetime import date
@@ -23,6 +25,8 @@ class PriceJob:
         self.loggerFileName = loggerFileName
         self.logger = create_log(loggerName='YahooStats', loggerFileName=self.loggerFileName)
         self.use_tqdm = use_tqdm
+        # rows handed to the batch writer, checked once the writer is flushed
+        self.pending_writes = PendingWrites()
 
     def _run_each_stock(self, stock):
         self.logger.info(f"Start Processing stock = {stock}")
@@ -39,8 +43,9 @@ class PriceJob:
             self.logger.debug(f"Failed:Processing stock = {stock}")
         else:
             try:
-                DatabaseManagement(data_df=stock_df, table='price', insert_index=True).insert_db()
-                self.logger.info(f"Success: Entered stock = {stock}")
+                self.pending_writes.add(stock, DatabaseManagement(data_df=stock_df, table='price', insert_index=True,
+                                                                  buffered=True, bulk_load=True,
+                                                                  mode='ignore').insert_db())
             except DatabaseManagementError as e:
                 self.logger.debug(f"Failed: Entering stock = {stock}, {e}")
 
@@ -57,10 +62,24 @@ class PriceJob:
 
         self.logger.info(f'There are {len(stocks)} stocks to be extracted')
 
+        # longest histories first, from the time each stock took in the previous runs
+        history = TaskHistory('price_job')
+        timings = TaskTimings()
         if self.batch_run:
-            parallel_process(stocks, self._run_each_stock, self.workers, use_tqdm=self.use_tqdm)
+            parallel_process(stocks, self._run_each_stock, self.workers, use_tqdm=self.use_tqdm,
+                             cost=history.estimates(), timings=timings)
         else:
-            parallel_process(stocks, self._run_each_stock, 1)
+            parallel_process(stocks, self._run_each_stock, 1, timings=timings)
+        history.update(timings.durations)
+        self.logger.info(f"Extraction: {timings.report()}")
+        # the SQL output is read back from the table
+        for line in flush_batch_writer():
+            self.logger.info(f"Writer {line}")
+        for stock, rows, e in self.pending_writes.collect():
+            if e is None:
+                self.logger.info(f"Success: Entered stock = {stock}, {rows} rows")
+            else:
+                self.logger.debug(f"Failed: Entering stock = {stock}, {e}")
 
         self.logger.info(f"-----Start generate SQL outputs-----")
         insert = write_insert_db('price', self.updated_dt)
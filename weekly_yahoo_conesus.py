@@ -3,6 +3,7 @@ import sys
 from util.helper_functions import create_log
 from util.transfer_data import UploadData2GCP
 from util.send_email import SendEmail
+from util.request_website import connection_stats, transfer_stats, transfer_report
 from modules.extract_yahoo_consensus import YahooAnalysis
 
 
@@ -26,12 +27,16 @@ def CensusExtractions(runtime):
                            use_tqdm=True,
                            test_size=None)
     consus.run_job()
+    conn = connection_stats()
 
     SendEmail(content=f"""{'-'*80}\n"""
                       f'Weekly consensus job finished for {runtime}\n'
                       f"""{'-'*80}\n"""
                       f"""{consus.get_failed_extracts}/{consus.no_of_stock} Failed Extractions. \n"""
+                      f"""{consus.get_deferred_extracts} Deferred Extractions (circuit open). \n"""
                       f"""The job made {consus.no_of_web_calls} calls through the internet. \n"""
+                      f"""Connections: {conn['new_connections']} opened, {conn['reused_connections']} re-used. \n"""
+                      f"""{transfer_report(transfer_stats())}"""
                       f"""Target Table: yahoo_consensus\n"""
                       f"""Target Population: YAHOO_STOCK_ALL\n"""
                       f"""Log: {loggerFileName}\n"""